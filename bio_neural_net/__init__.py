@@ -1,3 +1,14 @@
+__version__ = '0.1.0'
+
 from .neuron import *
 from .synapse import *
 from .network import *
+from .integrators import *
+
+
+def __getattr__(name):
+    '''Import the array backed engine, and scipy, on first use.'''
+    if name == 'ArrayNetwork':
+        from .array_network import ArrayNetwork
+        return ArrayNetwork
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
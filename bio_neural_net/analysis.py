@@ -0,0 +1,204 @@
+'''Cached, incrementally extended analysis of simulation results.
+
+The rates of rate_matrix, on the grid zs = start_time + k*dz, and their
+sums over the EB regions are stored as .npy files, read back memory
+mapped, under
+    <cache>/<lineage>/<num points>-<digest>/
+The lineage is a hash of the clusters, the time grid of the results, the
+kernel scale and dz, and the digest a hash of the spikes up to the last
+grid point. A results file whose spikes match those of a cached entry up
+to its last grid point, e.g. a run continued from a shorter one, reuses
+the cached columns: the rates at the last cached point decay into the
+new grid points, to which only the spikes after it are added, exactly
+as rate_matrix would compute them. Once the entries exceed max_bytes the
+least recently used ones are removed, as in experiment.ResultCache.
+
+Example
+    cache = AnalysisCache()
+    zs, EB_rates = cache.region_rates(SimulationResults('sim2.spikes'))
+'''
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from . import __version__
+from .fruit_fly_network import CACHE_DIR
+from .rates import rate_matrix, region_matrix
+
+ANALYSIS_CACHE_DIR = os.path.join(CACHE_DIR, 'analysis')
+
+
+def _grid(results, dz: float):
+    '''The grid points start_time + k*dz up to the last time step.'''
+    ts = results.ts
+    count = int(np.floor((ts[-1] - ts[0])/dz + 1e-9)) + 1
+    return ts[0] + np.arange(count)*dz
+
+
+def _stop(results, z: float) -> int:
+    '''The number of time steps at or before time z.'''
+    return int(np.searchsorted(results.ts, z, side='right'))
+
+
+def _digest(results, stop: int) -> str:
+    '''A hash of the spikes of every cluster before time index stop.'''
+    digest = hashlib.sha256()
+    for name in results.keys():
+        indices = results.firing_time_indices(name, stop=stop)
+        digest.update(np.int64(len(indices)).tobytes())
+        digest.update(indices.astype(np.int64).tobytes())
+    return digest.hexdigest()[:24]
+
+
+def _size(entry: str) -> int:
+    return sum(os.path.getsize(os.path.join(entry, name))
+               for name in os.listdir(entry))
+
+
+class AnalysisCache:
+    '''A directory of rate matrices and region rates, see the module
+    docstring.'''
+    def __init__(self, path: str = ANALYSIS_CACHE_DIR,
+                 max_bytes: int = 1 << 30):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _lineage(self, results, scale: float, dz: float) -> str:
+        encoded = json.dumps([__version__, list(results.keys()),
+                              results.start_time, results.dt, scale, dz])
+        return os.path.join(self.path,
+                            hashlib.sha256(encoded.encode()).hexdigest()[:24])
+
+    def _entries(self, lineage: str):
+        '''The (number of grid points, path) of the entries of lineage,
+        longest first.'''
+        if not os.path.isdir(lineage):
+            return []
+        entries = []
+        for name in os.listdir(lineage):
+            try:
+                with open(os.path.join(lineage, name, 'meta.json')) as f:
+                    entries.append((json.load(f)['num_points'],
+                                    os.path.join(lineage, name)))
+            except (OSError, ValueError):
+                continue  # incomplete
+        return sorted(entries, reverse=True)
+
+    def _load(self, entry: str, name: str):
+        path = os.path.join(entry, f'{name}.npy')
+        return np.load(path, mmap_mode='r') if os.path.exists(path) else None
+
+    def _write(self, lineage: str, key: str, num_points: int,
+               arrays: dict) -> str:
+        '''Store a new entry atomically and return its path.'''
+        entry = os.path.join(lineage, key)
+        temp = f'{entry}.{os.getpid()}.tmp'
+        os.makedirs(temp, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(temp, f'{name}.npy'), array)
+        with open(os.path.join(temp, 'meta.json'), 'w') as f:
+            json.dump({'num_points': num_points}, f)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(temp, entry)
+        self.evict(keep=entry)
+        return entry
+
+    def evict(self, keep: str = None):
+        '''Remove the least recently used entries, other than keep, until
+        the entries fit into max_bytes.'''
+        entries = [entry
+                   for lineage in os.listdir(self.path)
+                   for _, entry in self._entries(
+                           os.path.join(self.path, lineage))]
+        entries.sort(key=os.path.getmtime)
+        total = sum(map(_size, entries))
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            total -= _size(entry)
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def _entry(self, results, scale: float, dz: float, regions: bool):
+        '''The path of the entry of results, computing what is missing.'''
+        zs = _grid(results, dz)
+        key = f'{len(zs)}-{_digest(results, _stop(results, zs[-1]))}'
+        lineage = self._lineage(results, scale, dz)
+        entry = os.path.join(lineage, key)
+        if os.path.exists(os.path.join(entry, 'meta.json')):
+            if not regions or self._load(entry, 'EB_rates') is not None:
+                os.utime(entry)  # mark as recently used
+                return entry
+            rates = self._load(entry, 'rates')
+            return self._write(lineage, key, len(zs), {
+                'rates': rates,
+                'EB_rates': self._regions(results) @ rates})
+
+        # the longest cached prefix of these results
+        prefix = None
+        for num_points, path in self._entries(lineage):
+            if num_points <= len(zs) and os.path.basename(path) == \
+                    f'{num_points}-' + \
+                    _digest(results, _stop(results, zs[num_points-1])):
+                prefix = num_points, path
+                break
+
+        if prefix is None:
+            rates = rate_matrix(results, results.ts, zs, scale)
+        else:
+            num_points, path = prefix
+            rates = np.empty((len(results.keys()), len(zs)))
+            rates[:, :num_points] = self._load(path, 'rates')
+            rates[:, num_points-1:] = self._extend(
+                    results, rates[:, num_points-1], zs[num_points-1:], scale)
+        arrays = {'rates': rates}
+        if regions:
+            arrays['EB_rates'] = self._regions(results) @ rates
+        return self._write(lineage, key, len(zs), arrays)
+
+    def _extend(self, results, last, zs, scale: float):
+        '''The rates on zs, given their values last at zs[0], from the
+        spikes after zs[0] only.'''
+        start = _stop(results, zs[0])
+        ts = results.ts
+        new = {name: results.firing_time_indices(name, start=start)
+               for name in results.keys()}
+        # spikes on zs[0] were counted half there and fully from then on
+        on_grid = np.array([
+            np.count_nonzero(ts[results.firing_time_indices(
+                name, start=start - 1, stop=start)] == zs[0])
+            for name in results.keys()])
+        decay = np.exp(-(zs - zs[0])/scale)
+        extended = np.outer(last + .5*on_grid/scale, decay) + \
+            rate_matrix(new, ts, zs, scale)
+        extended[:, 0] = last
+        return extended
+
+    def _regions(self, results):
+        from .fruit_fly_network import EB_INNERVATION
+        return region_matrix(EB_INNERVATION, results.keys())
+
+    def rates(self, results, scale: float = 0.05, dz: float = 0.01):
+        '''The grid zs and the (clusters, len(zs)) rates of a
+        SimulationResults, memory mapped.'''
+        entry = self._entry(results, scale, dz, regions=False)
+        return _grid(results, dz), self._load(entry, 'rates')
+
+    def region_rates(self, results, scale: float = 0.05, dz: float = 0.01):
+        '''The grid zs and the (EB regions, len(zs)) rates of a
+        SimulationResults, memory mapped.'''
+        entry = self._entry(results, scale, dz, regions=True)
+        return _grid(results, dz), self._load(entry, 'EB_rates')
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __str__(self):
+        return f'AnalysisCache: {self.path}'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
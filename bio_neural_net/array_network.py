@@ -0,0 +1,485 @@
+'''An array backed simulation engine for the model from Su et al. 2017
+https://www.nature.com/articles/s41467-017-00191-6
+
+The object API in network.py, neuron.py and synapse.py is used to build
+a network and remains the reference implementation. An ArrayNetwork is
+compiled from one or more built networks and packs all of the state into
+contiguous arrays so that each time step is a handful of vectorized
+operations.
+
+Every state array carries a leading replica axis. Networks compiled
+together must share their clusters and connections but may differ in any
+parameter (conductances, input frequencies, cluster sizes, ...), so that
+a whole parameter sweep advances in a single step loop.
+'''
+import numpy as np
+import scipy.sparse as sp
+
+from .neuron import InputNeuronCluster
+from .probes import Probe
+from .recorder import SpikeRecorder
+from .state import pack_state, unpack_state
+from .synapse import NMDASynapseCluster
+from .stepping import run_in_blocks
+
+
+class ArrayNetwork:
+    '''A compiled, array backed copy of one or more Networks.
+
+    Clusters are indexed in the order they were added to the network and
+    synapses in the order the connections were added. Synapses shared by
+    Network.add_synapse are compiled once, exactly as in the object model,
+    as long as they are shared in every replica.
+    '''
+    def __init__(self, nets):
+        if not isinstance(nets, (list, tuple)):
+            nets = [nets]
+        self.nets = list(nets)
+        self.net = self.nets[0]
+        self.replicas = len(self.nets)
+        # the original index of every replica still simulated, see
+        # drop_replicas
+        self.replica_ids = np.arange(self.replicas)
+        self._recorder_ids = None
+
+        self.start_time = self.net.start_time
+        self.dt = self.net.dt
+        self.num_steps = self.net.num_steps
+
+        self.time = None
+        self.time_index = None
+
+        self.names = list(self.net.neurons.keys())
+        self.index = {name: i for i, name in enumerate(self.names)}
+        for net in self.nets[1:]:
+            assert list(net.neurons.keys()) == self.names, \
+                f'{net} does not share the clusters of {self.net}.'
+            assert net.synapses.keys() == self.net.synapses.keys(), \
+                f'{net} does not share the connections of {self.net}.'
+        self.is_input = np.array([
+            isinstance(neuron, InputNeuronCluster)
+            for neuron in self.net.neurons.values()])
+
+        # Input clusters carry no membrane, these values keep their
+        # (unused) potential fixed at zero and never reach threshold.
+        # A nonzero leak keeps the integrators' rate positive.
+        def param(attr, input_value):
+            return np.array([
+                [input_value if is_input else getattr(neuron, attr)
+                 for neuron, is_input in zip(net.neurons.values(),
+                                             self.is_input)]
+                for net in self.nets], dtype=float)
+        self.Cm = param('Cm', 1.0)
+        self.gL = param('gL', 1.0)
+        self.VL = param('VL', 0.0)
+        self.threshold = param('threshold', np.inf)
+
+        self._compile_synapses()
+
+        self.recorder = SpikeRecorder(self.names, self.replicas,
+                                      record_times=True)
+        self.probes = []
+        # steps of input spikes sorted at a time, see _schedule_window
+        self.schedule_window = 10_000
+
+        self.V = None
+        self.firing = None
+        self.gating = None
+        self.syn_decay = None
+
+    def _compile_synapses(self):
+        def syn_params(syn):
+            nmda = isinstance(syn, NMDASynapseCluster)
+            # NMDASynapseCluster.current does not scale by presynaptic size
+            return (syn.time_constant,
+                    syn.reversal_potential,
+                    syn.max_conductance * (1 if nmda else syn.pre_size),
+                    syn.ALPHA if nmda else 0.0)
+
+        columns = {}
+        syn_index = {}
+        syn_pre = []
+        syn_nmda = []
+        params = []
+        rows, cols = [], []
+        for name, syn in self.net.synapses.items():
+            pre, post = name
+            syns = [net.synapses[name] for net in self.nets]
+            assert len({type(s) for s in syns}) == 1, \
+                f'The {name} synapse type differs between replicas.'
+            # reuse a column when every replica shares the synapse object
+            key = tuple(id(s) for s in syns)
+            if key not in columns:
+                columns[key] = len(syn_pre)
+                syn_pre.append(self.index[pre])
+                syn_nmda.append(isinstance(syn, NMDASynapseCluster))
+                params.append([syn_params(s) for s in syns])
+            col = columns[key]
+            syn_index[name] = col
+            rows.append(self.index[post])
+            cols.append(col)
+
+        # (replica, synapse, param)
+        params = np.array(params, dtype=float).reshape(
+                len(syn_pre), self.replicas, 4).transpose(1, 0, 2)
+        self.syn_index = syn_index
+        self.syn_pre = np.array(syn_pre, dtype=int)
+        self.syn_nmda = np.array(syn_nmda, dtype=bool)
+        self.syn_tau = params[..., 0]
+        self.syn_E = params[..., 1]
+        self.syn_gmax = params[..., 2]
+        self.syn_alpha = params[..., 3]
+
+        mg2 = {syn.MG2 for net in self.nets
+               for syn in net.synapses.values()
+               if isinstance(syn, NMDASynapseCluster)}
+        assert len(mg2) <= 1, 'NMDA synapses must share a Mg2+ concentration.'
+        self.mg2 = mg2.pop() if mg2 else NMDASynapseCluster.MG2
+
+        # post x synapse wiring, weighted on the fly by the gating
+        self.wiring = sp.csr_matrix(
+                (np.ones(len(rows)), (rows, cols)),
+                shape=(len(self.names), len(syn_pre)))
+
+    def _compile_inputs(self):
+        '''Precompute the spike indices of every input cluster in every
+        replica, input_schedules[id] for the flat (replica, cluster) id,
+        and schedule the window of steps from the current one.'''
+        self.input_schedules = [
+            net[name].compute_spike_indices(self.start_time, self.dt)
+            if is_input else np.zeros(0, dtype=int)
+            for net in self.nets
+            for name, is_input in zip(self.names, self.is_input)]
+        self._input_ids = np.flatnonzero(np.tile(self.is_input,
+                                                 self.replicas))
+        self._schedule_window(self.time_index or 0)
+
+    def _schedule_window(self, first: int):
+        '''Sort the input spikes of the schedule_window steps from first
+        by step as (schedule_offsets, schedule_ids), so that the flat ids
+        firing on step t of the window are
+            schedule_ids[schedule_offsets[t - first]:
+                         schedule_offsets[t - first + 1]]
+        and keep their sorted steps as schedule_steps. The memory and
+        work are bounded by the window and the input spikes in it, not
+        by the length of the run.'''
+        last = first + self.schedule_window
+        steps, ids = [np.zeros(0, dtype=int)], [np.zeros(0, dtype=int)]
+        for i in self._input_ids:
+            spikes = self.input_schedules[i]
+            lo, hi = np.searchsorted(spikes, (first, last))
+            steps.append(spikes[lo:hi])
+            ids.append(np.full(hi - lo, i))
+        steps, ids = np.concatenate(steps), np.concatenate(ids)
+        order = np.argsort(steps, kind='stable')
+        self.schedule_steps = steps[order]
+        self.schedule_ids = ids[order]
+        self.schedule_offsets = np.zeros(self.schedule_window + 1, dtype=int)
+        np.cumsum(np.bincount(steps - first, minlength=self.schedule_window),
+                  out=self.schedule_offsets[1:])
+        self._window = (first, last)
+
+    def set_time_params(self, start_time: float, dt: float, num_steps: int):
+        self.start_time = start_time
+        self.dt = dt
+        self.num_steps = num_steps
+
+    def reset(self):
+        assert self.start_time is not None
+        self.time = self.start_time
+        self.time_index = 0
+
+        shape = (self.replicas, len(self.names))
+        self.V = self.VL.copy()
+        self.firing = np.zeros(shape, dtype=bool)
+        self.gating = np.zeros(self.syn_gmax.shape)
+
+        # exact exponential decay for event driven synapses
+        if self.net.event_synapses:
+            self.syn_decay = np.exp(-self.dt/self.syn_tau)
+        else:
+            self.syn_decay = 1 - self.dt/self.syn_tau
+
+        self._compile_inputs()
+
+        self.recorder.clear()
+        for probe in self.probes:
+            probe.reset(self.start_time, self.dt, self.num_steps)
+            probe.sample(self.time_index)
+
+    def drop_replicas(self, replicas):
+        '''Stop simulating replicas, given by their original index, e.g.
+        once a monitor aborted them. Their spikes recorded so far are
+        kept and the remaining replicas keep their ids in the recorder,
+        while the rows of the state arrays only hold the replicas left.'''
+        assert not self.probes, \
+            'Replicas cannot be dropped from an engine with probes.'
+        drop = set(replicas)
+        keep = [row for row, replica in enumerate(self.replica_ids)
+                if replica not in drop]
+        self.nets = [self.nets[row] for row in keep]
+        self.replica_ids = self.replica_ids[keep]
+        self.replicas = len(keep)
+        for attr in ('Cm', 'gL', 'VL', 'threshold',
+                     'syn_tau', 'syn_E', 'syn_gmax', 'syn_alpha',
+                     'V', 'firing', 'gating', 'syn_decay'):
+            value = getattr(self, attr)
+            if value is not None:
+                setattr(self, attr, value[keep])
+        if self.time_index is not None:
+            self._compile_inputs()
+        self._number_replicas(self.replica_ids)
+
+    def _number_replicas(self, replica_ids):
+        '''Record the spikes of the rows as those of the replicas
+        replica_ids.'''
+        n = len(self.names)
+        self.replica_ids = np.asarray(replica_ids)
+        self._recorder_ids = (self.replica_ids[:, None]*n +
+                              np.arange(n)).ravel()
+
+    def snapshot(self) -> bytes:
+        '''The state of the simulation, potentials, firing flags,
+        synapses and the recorded spikes, as a compact blob for restore.
+        Probes are not included.'''
+        assert self.time_index is not None, 'The engine has not been reset.'
+        return pack_state(
+            'ArrayNetwork',
+            time_index=self.time_index,
+            V=self.V,
+            firing=self.firing,
+            gating=self.gating,
+            replica_ids=self.replica_ids,
+            spikes=self.recorder.table(),
+            spike_times=self.recorder.times())
+
+    def restore(self, blob: bytes):
+        '''Reset the engine and continue from a snapshot taken of this
+        engine, or of one compiled the same way. Input spikes are
+        scheduled from the current intervals of the networks, which may
+        differ from those of the snapshot. Replicas dropped from the
+        snapshot are dropped from this engine as well.'''
+        state = unpack_state(blob, 'ArrayNetwork')
+        replica_ids = state['replica_ids']
+        dropped = set(self.replica_ids.tolist()) - set(replica_ids.tolist())
+        assert set(replica_ids.tolist()) <= set(self.replica_ids.tolist()), \
+            'The snapshot holds replicas this engine does not simulate.'
+        if dropped:
+            self.drop_replicas(dropped)
+        assert state['gating'].shape == self.syn_gmax.shape, \
+            'The snapshot was taken of a different network.'
+        self.reset()
+        self.time_index = int(state['time_index'])
+        self.time = self.start_time + self.time_index * self.dt
+        self.V = state['V']
+        self.firing = state['firing']
+        self.gating = state['gating']
+        self.recorder.record_table(state['spikes'], state['spike_times'])
+        for probe in self.probes:
+            probe.reset(self.start_time, self.dt, self.num_steps)
+            probe.sample(self.time_index)
+
+    def reschedule_inputs(self, names=None):
+        '''Recompute the input spikes after changing the intervals or
+        rates of the input clusters names, by default all of them, part
+        way through a run. Only the spikes of those clusters and the
+        current window are recomputed.'''
+        if names is None:
+            self._compile_inputs()
+            return
+        n = len(self.names)
+        for row, net in enumerate(self.nets):
+            for name in names:
+                self.input_schedules[row*n + self.index[name]] = \
+                    net[name].compute_spike_indices(self.start_time, self.dt)
+        self._schedule_window(self.time_index or 0)
+
+    def fork(self):
+        '''An independent copy of this engine, and of its networks, in
+        its current state, to continue with a different protocol. Probes
+        are not copied. Call reschedule_inputs on the fork after changing
+        the inputs of its networks.'''
+        clone = ArrayNetwork([net.fork() for net in self.nets])
+        if self._recorder_ids is not None:
+            # the clone holds only the replicas left, under their ids
+            clone.recorder = SpikeRecorder(self.names, self.recorder.replicas,
+                                           record_times=True)
+            clone._number_replicas(self.replica_ids)
+        clone.set_time_params(self.start_time, self.dt, self.num_steps)
+        clone.restore(self.snapshot())
+        return clone
+
+    def synaptic_input(self, V=None, gating=None):
+        '''The total synaptic current into and conductance of every
+        cluster.'''
+        if V is None:
+            V = self.V
+        if gating is None:
+            gating = self.gating
+        g = self.syn_gmax * gating
+        g_nmda = g * self.syn_nmda
+        g_plain = g - g_nmda
+        terms = self.wiring @ np.concatenate((
+            g_plain, g_plain*self.syn_E, g_nmda, g_nmda*self.syn_E)).T
+        terms = terms.T.reshape(4, *V.shape)
+        mg_block = 1/(1 + self.mg2*np.exp(-0.062*V/3.57))
+        current = V*terms[0] - terms[1] + mg_block*(V*terms[2] - terms[3])
+        return current, terms[0] + mg_block*terms[2]
+
+    def _step(self, steps: int = 1) -> bool:
+        '''Advance by steps time steps at once, holding the synaptic
+        conductances fixed over the whole interval. Multiple steps may
+        only be taken while no spikes occur, otherwise nothing is
+        updated and False is returned.'''
+        h = steps*self.dt
+        current, conductance = self.synaptic_input()
+        rhs = (-self.gL*(self.V - self.VL) - current)/self.Cm
+        rate = (self.gL + conductance)/self.Cm
+        V = self.net.integrator(self.V, rhs, rate, h)
+
+        firing = V >= self.threshold
+        if steps > 1:
+            if firing.any():
+                return False
+            # the exact decay, there are no presynaptic spikes to add
+            self.gating = self.gating*np.exp(-h/self.syn_tau)
+        else:
+            fired = self.firing[:, self.syn_pre]
+            jump = np.where(self.syn_nmda,
+                            self.syn_alpha*(1 - self.gating), 1.0)
+            self.gating = self.gating*self.syn_decay + fired*jump
+
+        # linearly interpolated threshold crossing within the step
+        crossing = np.zeros(V.shape)
+        np.divide(self.threshold - self.V, V - self.V,
+                  out=crossing, where=firing)
+        V[firing] = self.VL[firing]
+
+        firing.flat[self._scheduled_inputs()] = True
+
+        ids = np.flatnonzero(firing)
+        if len(ids):
+            times = self.time + crossing.ravel()[ids]*h
+            if self._recorder_ids is not None:
+                ids = self._recorder_ids[ids]
+            self.recorder.record(ids, self.time_index, times)
+
+        self.V = V
+        self.firing = firing
+        self.time_index += steps
+        self.time = self.start_time + self.time_index * self.dt
+
+        for probe in self.probes:
+            probe.sample(self.time_index)
+        return True
+
+    def _current_window(self):
+        '''The first step of the scheduled window, moved on to the
+        current step once it has passed.'''
+        first, last = self._window
+        if not first <= self.time_index < last:
+            self._schedule_window(self.time_index)
+        return self._window[0]
+
+    def _scheduled_inputs(self):
+        '''The flat ids of the input clusters firing on this step.'''
+        t = self.time_index - self._current_window()
+        return self.schedule_ids[
+                self.schedule_offsets[t]:self.schedule_offsets[t+1]]
+
+    def update(self):
+        self._step()
+
+    def advance(self, n_steps: int):
+        step = self._step
+        for _ in range(n_steps):
+            step()
+
+    def run(self, n_steps: int = None, callback=None, every: int = None):
+        '''Advance n_steps, calling callback(self) every `every` steps.
+        See run_in_blocks.'''
+        return run_in_blocks(self, n_steps, callback, every)
+
+    def update_adaptive(self, max_steps: int = 10, margin: float = 5.0):
+        '''Advance by up to max_steps time steps at once while every
+        cluster is more than margin (mV) below threshold, no spikes are
+        being transmitted and no input spikes are due. Steps that would
+        cross threshold are retaken with the base step size, where spike
+        times are interpolated. Best used with exact synapses and the
+        exponential integrator.'''
+        steps = 1
+        if not self.firing.any() and \
+                not (self.V >= self.threshold - margin).any():
+            steps = min(max_steps, self.num_steps - self.time_index)
+            self._current_window()
+            k = np.searchsorted(self.schedule_steps, self.time_index)
+            # beyond the window the input spikes are not yet scheduled
+            next_input = self.schedule_steps[k] \
+                if k < len(self.schedule_steps) else self._window[1]
+            steps = min(steps, next_input - self.time_index)
+        if steps <= 1 or not self._step(steps):
+            self._step()
+
+    def simulate_adaptive(self, max_steps: int = 10, margin: float = 5.0):
+        self.reset()
+        yield self
+        while self.time_index < self.num_steps:
+            self.update_adaptive(max_steps, margin)
+            yield self
+
+    def simulate(self):
+        self.reset()
+        yield self
+        for _ in range(self.num_steps):
+            self.update()
+            yield self
+
+    def probe(self, quantity: str, targets: list, stride: int = 1,
+              capacity: int = None) -> Probe:
+        '''Record the potential 'V' of the named clusters, or the
+        'gating' or 'current' of the synapses named by (pre, post), every
+        stride steps. Samples have shape (replicas, len(targets)). See
+        Probe.'''
+        if quantity == 'V':
+            clusters = [self.index[name] for name in targets]
+
+            def read():
+                return self.V[:, clusters]
+        elif quantity == 'gating':
+            cols = [self.syn_index[key] for key in targets]
+
+            def read():
+                return self.gating[:, cols]
+        elif quantity == 'current':
+            cols = [self.syn_index[key] for key in targets]
+            posts = [self.index[post] for _, post in targets]
+            nmda = self.syn_nmda[cols]
+
+            def read():
+                V = self.V[:, posts]
+                mg_block = 1/(1 + self.mg2*np.exp(-0.062*V/3.57))
+                g = self.syn_gmax[:, cols]*self.gating[:, cols]
+                return np.where(nmda, g*mg_block, g) * \
+                    (V - self.syn_E[:, cols])
+        else:
+            raise ValueError(f'Cannot probe {quantity}.')
+        probe = Probe(read, quantity, targets, stride, capacity)
+        self.probes.append(probe)
+        if self.time_index is not None:
+            probe.reset(self.start_time, self.dt, self.num_steps)
+            probe.sample(self.time_index)
+        return probe
+
+    def voltage(self, name: str, replica: int = 0) -> float:
+        return self.V[replica, self.index[name]]
+
+    def synapse_gating(self, pre: str, post: str, replica: int = 0) -> float:
+        return self.gating[replica, self.syn_index[(pre, post)]]
+
+    def __str__(self):
+        return f'ArrayNetwork: {len(self.names)} neurons, ' + \
+               f'{len(self.syn_pre)} synapse clusters, ' + \
+               f'{self.replicas} replicas'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
@@ -0,0 +1,137 @@
+'''Online decoding of the EB activity bump.
+
+A BumpDecoder is passed as the callback of an engine's run method and is
+called every `every` steps. It keeps the rates of the EB regions,
+filtered with the kernel of rates.py, and updates them from the spikes
+recorded since its last call only: the rates decay by
+    exp(-(t - t_last)/scale)
+and every new spike adds its kernel at t. Spikes of the current time
+step are only recorded during the next step, so unlike rate_matrix the
+rates never count half a spike at t. Each call appends the
+population vector angle of the region rates, with region k of K at angle
+2*pi*k/K, and the bump amplitude, the length of the population vector
+divided by K, to a Probe. The state is O(regions) per replica, and with
+discard_spikes the recorded spikes are dropped once decoded, so long and
+closed loop runs need not keep every spike.
+
+Example
+    decoder = BumpDecoder()
+    engine.run(steps, callback=decoder, every=100)
+    decoder.times, decoder.angle, decoder.amplitude
+'''
+import numpy as np
+
+from .probes import Probe
+
+
+class BumpDecoder:
+    '''Decodes the bump position from the rates of the regions, by
+    default the EB regions of EB_INNERVATION. regions is a sparse
+    (regions, clusters) matrix as returned by rates.region_matrix, and
+    angles the angles of the regions in radians. With a capacity only
+    the latest samples are kept.'''
+    def __init__(self, regions=None, angles=None, scale: float = 0.05,
+                 capacity: int = None, discard_spikes: bool = False):
+        self.regions = regions
+        self.angles = angles
+        self.scale = scale
+        self.discard_spikes = discard_spikes
+        self.output = Probe(self._read, 'bump', ['angle', 'amplitude'],
+                            capacity=capacity)
+        self.rates = None
+        self._engine = None
+        self._position = 0
+        self._last_index = 0
+
+    def _bind(self, engine):
+        self._engine = engine
+        names = engine.names if hasattr(engine, 'names') \
+            else list(engine.neurons.keys())
+        if self.regions is None:
+            from .fruit_fly_network import EB_INNERVATION
+            from .rates import region_matrix
+            self.regions = region_matrix(EB_INNERVATION, names)
+        if self.angles is None:
+            num_regions = self.regions.shape[0]
+            self.angles = 2*np.pi*np.arange(num_regions)/num_regions
+        self._vector = np.exp(1j*np.asarray(self.angles))
+        self._names = len(names)
+        replicas = getattr(engine, 'replica_ids', np.arange(1))
+        self._replicas = int(replicas.max()) + 1
+        self.rates = np.zeros((self._replicas, self.regions.shape[0]))
+        # per cluster for the object model, which records on the clusters
+        self._position = 0 if hasattr(engine, 'recorder') \
+            else np.zeros(self._names, dtype=int)
+        self._last_index = engine.time_index
+        self.output.reset(engine.start_time, engine.dt, engine.num_steps)
+
+    def _new_spikes(self, engine):
+        '''The (ids, time indices) of the spikes since the last call.'''
+        if hasattr(engine, 'recorder'):
+            recorder = engine.recorder
+            rows = recorder.table(self._position)
+            if self.discard_spikes:
+                recorder.clear()
+                self._position = 0
+            else:
+                self._position += len(rows)
+            return rows[:, 0], rows[:, 1]
+        # the object model records spikes on the clusters
+        ids, time_indices = [], []
+        for i, neuron in enumerate(engine.neurons.values()):
+            new = neuron.firing_time_indices[self._position[i]:]
+            ids += [i]*len(new)
+            time_indices += new
+            if self.discard_spikes:
+                neuron.firing_time_indices.clear()
+                neuron.firing_times.clear()
+            else:
+                self._position[i] += len(new)
+        return np.array(ids, dtype=int), np.array(time_indices, dtype=int)
+
+    def _region_rates(self, ids, weights):
+        cluster_rates = np.bincount(
+                ids, weights=weights, minlength=self._replicas*self._names
+                ).reshape(self._replicas, self._names)/self.scale
+        return cluster_rates @ self.regions.T
+
+    def __call__(self, engine) -> bool:
+        '''Update the rates and sample the bump. Never stops the run.'''
+        if engine is not self._engine or \
+                engine.time_index < self._last_index:
+            self._bind(engine)
+        ids, time_indices = self._new_spikes(engine)
+        decay = np.exp(-(engine.time_index - self._last_index)*engine.dt /
+                       self.scale)
+        self._last_index = engine.time_index
+
+        ages = (engine.time_index - time_indices)*engine.dt
+        self.rates = self.rates*decay + \
+            self._region_rates(ids, np.exp(-ages/self.scale))
+        self.output.sample(engine.time_index)
+        return False
+
+    def _read(self):
+        vector = self.rates @ self._vector/len(self._vector)
+        return np.stack([np.angle(vector), np.abs(vector)], axis=-1)
+
+    @property
+    def times(self):
+        return self.output.times
+
+    @property
+    def angle(self):
+        '''The decoded angles, (samples, replicas), in (-pi, pi].'''
+        return self.output.values[..., 0]
+
+    @property
+    def amplitude(self):
+        '''The bump amplitudes in Hz, (samples, replicas).'''
+        return self.output.values[..., 1]
+
+    def __str__(self):
+        return f'BumpDecoder: {self.output.count} samples, ' + \
+               f'scale {self.scale}s'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
@@ -0,0 +1,312 @@
+'''An event driven simulator for the model from Su et al. 2017
+https://www.nature.com/articles/s41467-017-00191-6
+
+Instead of marching at a fixed step size, an EventNetwork jumps from
+event to event. A priority queue holds the scheduled input spikes, the
+delivery of every spike to its synapses and the predicted threshold
+crossing of every cluster that is able to fire. Between events the
+synapses decay exactly and the membrane potential follows the closed
+form solution of the LIF equation with the synaptic conductances
+averaged over the interval. Since the conductances keep decaying,
+crossings are predicted with the current conductances and re-checked at
+the predicted time, or after at most max_interval. Clusters that cannot
+reach threshold before their next input are not scheduled at all, so
+the work scales with the number of spikes rather than with time.
+
+As in the stepped engines, where a spike reaches the synapses one step
+later and a cluster fires at most once per step, spikes are transmitted
+with a delay and clusters have a refractory period. Both default to the
+network's step size.
+'''
+import heapq
+from math import exp, expm1, log
+
+import numpy as np
+
+from .array_network import ArrayNetwork
+from .recorder import SpikeRecorder
+from .stepping import run_in_blocks
+
+_INPUT, _CHECK, _DELIVER = range(3)
+
+
+class EventNetwork:
+    '''An event driven simulator compiled from a Network.'''
+    def __init__(self, net,
+                 max_interval: float = 1e-3,
+                 delay: float = None,
+                 refractory: float = None,
+                 tolerance: float = 1e-6):
+        self.net = net
+        self.max_interval = max_interval
+        self.delay = delay
+        self.refractory = refractory
+        self.tolerance = tolerance  # mV
+
+        # reuse the parameters compiled by the array backed engine, as
+        # plain Python values since events touch only a few of them
+        arrays = ArrayNetwork(net)
+        self.arrays = arrays
+        self.names = arrays.names
+        self.index = arrays.index
+        self.is_input = arrays.is_input.tolist()
+        self.Cm = arrays.Cm[0].tolist()
+        self.gL = arrays.gL[0].tolist()
+        self.VL = arrays.VL[0].tolist()
+        self.threshold = arrays.threshold[0].tolist()
+        self.mg2 = arrays.mg2
+
+        self.syn_nmda = arrays.syn_nmda.tolist()
+        self.syn_tau = arrays.syn_tau[0].tolist()
+        self.syn_E = arrays.syn_E[0].tolist()
+        self.syn_gmax = arrays.syn_gmax[0].tolist()
+        self.syn_alpha = arrays.syn_alpha[0].tolist()
+
+        n = len(self.names)
+        wiring = arrays.wiring.tocsr()
+        # synapses into, synapses out of and clusters targeted by each cluster
+        self.in_synapses = [
+            wiring.indices[wiring.indptr[i]:wiring.indptr[i+1]].tolist()
+            for i in range(n)]
+        self.out_synapses = [[] for _ in range(n)]
+        for j, pre in enumerate(arrays.syn_pre.tolist()):
+            self.out_synapses[pre].append(j)
+        wiring = wiring.tocsc()
+        self.targets = [
+            sorted({post for j in self.out_synapses[i]
+                    for post in wiring.indices[
+                        wiring.indptr[j]:wiring.indptr[j+1]].tolist()})
+            for i in range(n)]
+
+        self.recorder = SpikeRecorder(self.names, record_times=True)
+
+        self.start_time = net.start_time
+        self.dt = net.dt
+        self.num_steps = net.num_steps
+        self.time = None
+        # the number of whole steps of size dt the clock has been advanced
+        self.time_index = None
+
+        self.V = None
+        self.V_time = None
+        self.gating = None
+        self.gating_time = None
+        self.last_spike = None
+        self.queue = None
+        self.version = None
+
+    def set_time_params(self, start_time: float, dt: float, num_steps: int):
+        self.start_time = start_time
+        self.dt = dt
+        self.num_steps = num_steps
+
+    @property
+    def end_time(self):
+        return self.start_time + self.num_steps*self.dt
+
+    def reset(self):
+        assert self.start_time is not None
+        self.time = self.start_time
+        self.time_index = 0
+        n = len(self.names)
+        m = len(self.syn_gmax)
+        self.V = list(self.VL)
+        self.V_time = [self.start_time]*n
+        self.gating = [0.0]*m
+        self.gating_time = [self.start_time]*m
+        self.last_spike = [-float('inf')]*n
+        self.version = [0]*n
+        self.queue = []
+        self._sequence = 0
+        self._delay = self.dt if self.delay is None else self.delay
+        self._refractory = self.dt if self.refractory is None \
+            else self.refractory
+
+        self.arrays.set_time_params(self.start_time, self.dt, self.num_steps)
+        self.arrays._compile_inputs()
+        schedules = self.arrays.input_schedules
+        offsets = np.cumsum([0] + [len(s) for s in schedules])
+        self.input_spikes = np.concatenate(schedules).astype(int).tolist()
+        self.input_end = offsets[1:].tolist()
+        self.input_ptr = offsets[:-1].tolist()
+        for i in range(n):
+            if self.is_input[i]:
+                self._schedule_input(i)
+
+        self.recorder.clear()
+
+    def _push(self, time: float, kind: int, i: int):
+        self._sequence += 1
+        heapq.heappush(self.queue,
+                       (time, self._sequence, kind, i, self.version[i]))
+
+    def _schedule_input(self, i: int):
+        if self.input_ptr[i] < self.input_end[i]:
+            index = self.input_spikes[self.input_ptr[i]]
+            self._push(self.start_time + index*self.dt, _INPUT, i)
+
+    def _gating_at(self, j: int, time: float) -> float:
+        if self.gating[j] == 0:
+            return 0.0
+        return self.gating[j]*exp(
+                -(time - self.gating_time[j])/self.syn_tau[j])
+
+    def _conductances(self, i: int, V: float, gatings):
+        '''The total conductance and conductance weighted reversal
+        potential of the synapses into cluster i.'''
+        mg_block = 1/(1 + self.mg2*exp(-0.062*V/3.57))
+        G = GE = 0.0
+        for j, gating in zip(self.in_synapses[i], gatings):
+            g = self.syn_gmax[j]*gating
+            if self.syn_nmda[j]:
+                g *= mg_block
+            G += g
+            GE += g*self.syn_E[j]
+        return G, GE
+
+    def _advance(self, i: int, time: float):
+        '''Advance the potential of cluster i to time.'''
+        interval = time - self.V_time[i]
+        if interval <= 0 or self.is_input[i]:
+            return
+        # the mean of the exactly decaying gatings over the interval
+        gatings = [
+            self._gating_at(j, self.V_time[i]) *
+            -expm1(-interval/self.syn_tau[j])*self.syn_tau[j]/interval
+            for j in self.in_synapses[i]]
+        G, GE = self._conductances(i, self.V[i], gatings)
+        G_total = self.gL[i] + G
+        V_inf = (self.gL[i]*self.VL[i] + GE)/G_total
+        self.V[i] = V_inf + (self.V[i] - V_inf) * \
+            exp(-G_total/self.Cm[i]*interval)
+        self.V_time[i] = time
+
+    def _predict(self, i: int):
+        '''Schedule the next threshold check of cluster i, which has been
+        advanced to the current time.'''
+        self.version[i] += 1
+        earliest = max(self.time, self.last_spike[i] + self._refractory)
+        theta = self.threshold[i]
+        if self.V[i] >= theta:
+            self._push(earliest, _CHECK, i)
+            return
+        gatings = [self._gating_at(j, self.time) for j in self.in_synapses[i]]
+        G, GE = self._conductances(i, self.V[i], gatings)
+        G_total = self.gL[i] + G
+        V_inf = (self.gL[i]*self.VL[i] + GE)/G_total
+        if V_inf > theta:
+            crossing = log((self.V[i] - V_inf)/(theta - V_inf)) * \
+                self.Cm[i]/G_total
+            self._push(max(earliest, self.time +
+                           min(crossing, self.max_interval)), _CHECK, i)
+            return
+        # Decaying inhibition may still release the cluster, bound the
+        # potential using only the excitatory synapses, which only decay.
+        excitatory = [gating if self.syn_E[j] > theta else 0.0
+                      for j, gating in zip(self.in_synapses[i], gatings)]
+        G, GE = self._conductances(i, theta, excitatory)
+        if (self.gL[i]*self.VL[i] + GE)/(self.gL[i] + G) > theta:
+            self._push(max(earliest, self.time + self.max_interval),
+                       _CHECK, i)
+
+    def _fire(self, i: int):
+        time = self.time
+        if self.is_input[i]:
+            # the scheduled step, which the time may miss by float error
+            index = self.input_spikes[self.input_ptr[i]]
+        else:
+            index = round((time - self.start_time)/self.dt)
+        self.recorder.record((i,), index, (time,))
+        self.last_spike[i] = time
+        self._push(time + self._delay, _DELIVER, i)
+        if self.is_input[i]:
+            self.input_ptr[i] += 1
+            self._schedule_input(i)
+        else:
+            self.V[i] = self.VL[i]
+            self._predict(i)
+
+    def _deliver(self, i: int):
+        '''Apply the spike of cluster i to its output synapses.'''
+        time = self.time
+        for k in self.targets[i]:
+            self._advance(k, time)
+        for j in self.out_synapses[i]:
+            gating = self._gating_at(j, time)
+            if self.syn_nmda[j]:
+                gating += self.syn_alpha[j]*(1 - gating)
+            else:
+                gating += 1
+            self.gating[j] = gating
+            self.gating_time[j] = time
+        for k in self.targets[i]:
+            self._predict(k)
+
+    def step(self, until: float = None):
+        '''Process the next event up to the time until (by default the
+        end time). Returns whether a cluster fired, or None once there
+        are no events left.'''
+        if until is None:
+            until = self.end_time
+        while self.queue:
+            time, _, kind, i, version = self.queue[0]
+            if time > until:
+                break
+            heapq.heappop(self.queue)
+            if kind == _CHECK and version != self.version[i]:
+                continue  # superseded prediction
+            self.time = time
+            if kind == _INPUT:
+                self._fire(i)
+                return True
+            if kind == _DELIVER:
+                self._deliver(i)
+                return False
+            self._advance(i, time)
+            if self.V[i] >= self.threshold[i] - self.tolerance:
+                self._fire(i)
+                return True
+            self._predict(i)
+            return False
+        return None
+
+    def _finish(self, time: float):
+        '''Bring the clock and every cluster up to time.'''
+        self.time = time
+        for i in range(len(self.names)):
+            self._advance(i, self.time)
+
+    def advance(self, n_steps: int):
+        '''Process all events within the next n_steps steps of size dt.'''
+        self.time_index += n_steps
+        until = self.start_time + self.time_index*self.dt
+        while self.step(until) is not None:
+            pass
+        self._finish(until)
+
+    def run(self, n_steps: int = None, callback=None, every: int = None):
+        '''Advance n_steps, calling callback(self) every `every` steps.
+        See run_in_blocks.'''
+        return run_in_blocks(self, n_steps, callback, every)
+
+    def simulate(self):
+        '''Yield after every spike.'''
+        self.reset()
+        yield self
+        while (fired := self.step()) is not None:
+            if fired:
+                yield self
+        self.time_index = self.num_steps
+        self._finish(self.end_time)
+
+    def voltage(self, name: str) -> float:
+        i = self.index[name]
+        self._advance(i, self.time)
+        return self.V[i]
+
+    def __str__(self):
+        return f'EventNetwork: {len(self.names)} neurons, ' + \
+               f'{len(self.syn_gmax)} synapse clusters'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
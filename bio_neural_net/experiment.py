@@ -0,0 +1,232 @@
+'''Declarative experiments on the fruit fly network with cached results.
+
+An experiment spec is a JSON or TOML file such as
+
+    {
+        "name": "sim2",
+        "start_time": 0.0,
+        "end_time": 10.0,
+        "dt": 1e-4,
+        "cue_dict": {"EB-L1_input": [[0, 1.0]], "rot_CW": [[4.15, 5.0]]},
+        "overrides": {
+            "conductance_dict": {"EIP->PEI": 11, "PEI->EIP": 7},
+            "input_neurons": {"rot_CW": {"freq": 50, "size": 1}}
+        },
+        "record": ["EIP0", "EIP1"],
+        "engine": {"integrator": "euler", "event_synapses": false}
+    }
+
+overrides are keyword arguments of get_fruit_fly_network, merged into
+the defaults, with the (pre, post) keys of conductance_dict written as
+"pre->post". record and engine are optional, by default every cluster is
+recorded with the forward Euler engine.
+
+Results are stored in a cache directory under the hash of the spec and
+the package version, and the oldest results are evicted once the cache
+exceeds its size limit. Run a spec with
+    python -m bio_neural_net.experiment experiments/sim2.json
+and request its results from analysis scripts with
+    results = get_results('experiments/sim2.json')
+'''
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+from tqdm import tqdm
+
+from . import __version__
+from .fruit_fly_network import CACHE_DIR, get_fruit_fly_network
+from .results import SimulationResults, save_results
+
+RESULT_CACHE_DIR = os.path.join(CACHE_DIR, 'results')
+DEFAULT_ENGINE = {'integrator': 'euler', 'event_synapses': False}
+
+
+def load_spec(path: str) -> dict:
+    if path.endswith('.toml'):
+        import tomllib
+        with open(path, 'rb') as f:
+            spec = tomllib.load(f)
+    else:
+        with open(path) as f:
+            spec = json.load(f)
+    spec.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    return spec
+
+
+def normalize_spec(spec: dict) -> dict:
+    '''The spec with its defaults filled in, so that equivalent specs
+    hash alike.'''
+    assert spec['end_time'] > spec['start_time']
+    return {
+        'name': spec.get('name'),
+        'start_time': float(spec['start_time']),
+        'end_time': float(spec['end_time']),
+        'dt': float(spec['dt']),
+        'cue_dict': {name: [[float(t0), float(tf)] for t0, tf in intervals]
+                     for name, intervals in spec.get('cue_dict', {}).items()},
+        'overrides': spec.get('overrides', {}),
+        'record': spec.get('record'),
+        'engine': {**DEFAULT_ENGINE, **spec.get('engine', {})}
+    }
+
+
+def spec_hash(spec: dict) -> str:
+    '''The content hash of a spec, ignoring its name.'''
+    spec = normalize_spec(spec)
+    del spec['name']
+    encoded = json.dumps([__version__, spec], sort_keys=True)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:24]
+
+
+def _overrides(spec: dict) -> dict:
+    '''The overrides of get_fruit_fly_network.'''
+    overrides = dict(spec['overrides'])
+    if 'conductance_dict' in overrides:
+        overrides['conductance_dict'] = {
+            tuple(key.split('->')): value
+            for key, value in overrides['conductance_dict'].items()}
+    return overrides
+
+
+def build_network(spec: dict):
+    '''The network of a spec with its cues, time parameters and engine
+    settings, ready to be compiled.'''
+    spec = normalize_spec(spec)
+    num_steps = round((spec['end_time'] - spec['start_time'])/spec['dt'])
+    net, = get_fruit_fly_network(overrides=[_overrides(spec)])
+    for name, intervals in spec['cue_dict'].items():
+        net[name].intervals += [tuple(interval) for interval in intervals]
+    net.set_time_params(spec['start_time'], spec['dt'], num_steps)
+    net.set_integrator(spec['engine']['integrator'])
+    net.set_event_synapses(spec['engine']['event_synapses'])
+    return net
+
+
+class ResultCache:
+    '''A directory of .spikes results named by spec hash. Once the files
+    exceed max_bytes the least recently used ones are removed.'''
+    def __init__(self, path: str = RESULT_CACHE_DIR,
+                 max_bytes: int = 1 << 30):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def file_path(self, key: str) -> str:
+        return os.path.join(self.path, f'{key}.spikes')
+
+    def get(self, key: str):
+        '''The cached results, or None.'''
+        path = self.file_path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # mark as recently used
+        return SimulationResults(path)
+
+    def put(self, key: str, spike_dict: dict, start_time: float,
+            dt: float, num_steps: int, spec: dict):
+        os.makedirs(self.path, exist_ok=True)
+        path = self.file_path(key)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        save_results(temp_path, spike_dict, start_time, dt, num_steps, spec)
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+        return SimulationResults(path)
+
+    def evict(self, keep: str = None):
+        entries = [os.path.join(self.path, name)
+                   for name in os.listdir(self.path)
+                   if name.endswith('.spikes')]
+        entries.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in entries)
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= os.path.getsize(path)
+            os.remove(path)
+
+    def __str__(self):
+        return f'ResultCache: {self.path}'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
+
+
+def run_experiment(spec: dict, progress: bool = True):
+    '''Simulate a spec, returning the (spike_dict, num_steps) of the
+    recorded clusters.'''
+    spec = normalize_spec(spec)
+    net = build_network(spec)
+    num_steps = net.num_steps
+    engine = net.compile()
+    engine.reset()
+
+    with tqdm(total=num_steps, disable=not progress) as bar:
+        def show_progress(engine):
+            bar.update(engine.time_index - bar.n)
+
+        engine.run(num_steps, callback=show_progress, every=1000)
+    if engine.time_index != num_steps:
+        # never cache a partial run as the result of the spec
+        raise RuntimeError(f'The run stopped at step {engine.time_index} '
+                           f'of {num_steps}.')
+
+    spike_dict = engine.recorder.spike_dict()
+    if spec['record'] is not None:
+        spike_dict = {name: spike_dict[name] for name in spec['record']}
+    return spike_dict, num_steps
+
+
+def get_results(spec, cache: ResultCache = None, run: bool = True,
+                force: bool = False, progress: bool = True):
+    '''The results of a spec, given as a dict or the path of a spec file,
+    from the cache when present. Otherwise the spec is simulated and
+    cached, unless run is False in which case None is returned.'''
+    if isinstance(spec, str):
+        spec = load_spec(spec)
+    if cache is None:
+        cache = ResultCache()
+    key = spec_hash(spec)
+    if not force:
+        results = cache.get(key)
+        if results is not None or not run:
+            return results
+    spike_dict, num_steps = run_experiment(spec, progress)
+    spec = normalize_spec(spec)
+    return cache.put(key, spike_dict, spec['start_time'], spec['dt'],
+                     num_steps, spec={'hash': key, **spec})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description='Run experiment specs, reusing cached results.')
+    parser.add_argument('specs', nargs='+', help='JSON or TOML spec files')
+    parser.add_argument('--force', action='store_true',
+                        help='simulate even if a cached result exists')
+    parser.add_argument('--cache-dir', default=RESULT_CACHE_DIR)
+    parser.add_argument('--max-bytes', type=int, default=1 << 30,
+                        help='size limit of the cache')
+    parser.add_argument('--output-dir',
+                        help='also copy each result to <name>.spikes here')
+    args = parser.parse_args(argv)
+
+    cache = ResultCache(args.cache_dir, args.max_bytes)
+    for path in args.specs:
+        spec = load_spec(path)
+        key = spec_hash(spec)
+        cached = not args.force and cache.get(key) is not None
+        print(f'{path}: {key} ' + ('cached' if cached else 'running'))
+        results = get_results(spec, cache, force=args.force)
+        if args.output_dir is not None:
+            os.makedirs(args.output_dir, exist_ok=True)
+            output = os.path.join(args.output_dir, f'{spec["name"]}.spikes')
+            shutil.copyfile(results.path, output)
+            print(f'Wrote {output}')
+        print(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,64 @@
 #!/usr/bin/python3
-import numpy as np
+'''The fruit fly central complex network of Su et al. 2017.
+
+With cache, built networks are stored in CACHE_DIR, keyed by a hash of
+the package version, of the source of this module and of topology.py,
+of the innervation tables and of the parameters, and later calls with
+the same parameters load the stored topology instead. Only the
+TOPOLOGY_CACHE_SIZE most recently used networks are kept. The fruit fly
+network loads no faster than it builds, about 4 ms either way, so the
+cache is off by default. pandas is only imported when the
+EB_INNERVATION or PB_INNERVATION tables are used.
+'''
+import hashlib
 import os.path
-import pandas as pd
-from itertools import product, chain
+from functools import lru_cache
 
+import numpy as np
+
+from . import __version__
 from .network import Network
 
 from .neuron import NeuronCluster, InputNeuronCluster
 
 from .synapse import SynapseCluster, NMDASynapseCluster
 
+from .topology import load_topology, save_topology
+
 PATH = os.path.dirname(os.path.realpath(__file__))
+CACHE_DIR = os.environ.get(
+        'BIO_NEURAL_NET_CACHE',
+        os.path.join(os.path.expanduser('~'), '.cache', 'bio_neural_net'))
+TOPOLOGY_CACHE_SIZE = 64  # files
+
+_TABLES = {
+    'EB_INNERVATION': 'EB_innervation.csv',
+    'PB_INNERVATION': 'PB_innervation.csv'
+}
+
+
+@lru_cache(maxsize=None)
+def _read_table(file_name: str):
+    '''The (index, columns, values) of an innervation table.'''
+    with open(os.path.join(PATH, file_name)) as f:
+        rows = [line.rstrip('\n').split(',') for line in f if line.strip()]
+    index = tuple(row[0] for row in rows[1:])
+    columns = tuple(rows[0][1:])
+    values = np.array([row[1:] for row in rows[1:]], dtype=float)
+    return index, columns, values
 
-EB_INNERVATION = pd.read_csv(
-        os.path.join(PATH, 'EB_innervation.csv'),
-        index_col=0)
-PB_INNERVATION = pd.read_csv(
-        os.path.join(PATH, 'PB_innervation.csv'),
-        index_col=0)
+
+def __getattr__(name):
+    '''Load the innervation tables as DataFrames on first use.'''
+    if name in _TABLES:
+        import pandas as pd
+        table = pd.read_csv(os.path.join(PATH, _TABLES[name]), index_col=0)
+        globals()[name] = table
+        return table
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+EB_REGIONS = _read_table(_TABLES['EB_INNERVATION'])[1]
 
 EIP_LABELS = [f'EIP{num}' for num in range(18)]
 PEI_LABELS = [f'PEI{num}' for num in range(16)]
@@ -66,7 +107,7 @@ NMDA_PARAMS = {
 
 INPUT_NEURONS = {
     **{name+'_input': {'size': 10, 'freq': 50}
-       for name in EB_INNERVATION.columns},
+       for name in EB_REGIONS},
     'rot_CW': {'size': 10, 'freq': 315},
     'rot_CCW': {'size': 10, 'freq': 315},
     'RPEN_input': {'size': 10, 'freq': 20},
@@ -74,13 +115,24 @@ INPUT_NEURONS = {
 }
 
 INPUT_SYNAPSE_CONDUCTANCE = {
-    **{name+'_input': 2.1 for name in EB_INNERVATION.columns},
+    **{name+'_input': 2.1 for name in EB_REGIONS},
     'rot_CW': 0.3,
     'rot_CCW': 0.3,
     'RPEN_input': 10,
     'RPEI_input': 10
 }
 
+def _merge_params(base, override):
+    '''Recursively update a copy of the nested parameter dictionary
+    base with the entries of override.'''
+    if not (isinstance(base, dict) and isinstance(override, dict)):
+        return override
+    merged = dict(base)
+    for key, value in override.items():
+        merged[key] = _merge_params(base.get(key), value)
+    return merged
+
+
 def get_fruit_fly_network(
             EIP_params=DEFAULT_NEURON_PARAMS,
             PEI_params=DEFAULT_NEURON_PARAMS,
@@ -93,110 +145,231 @@ def get_fruit_fly_network(
             NMDA_params=NMDA_PARAMS,
             conductance_dict=CONDUCTANCE_DICT,
             input_neurons=INPUT_NEURONS,
-            input_synapse_conductance=INPUT_SYNAPSE_CONDUCTANCE
+            input_synapse_conductance=INPUT_SYNAPSE_CONDUCTANCE,
+            overrides=None,
+            cache: bool = False
         ):
+    '''Construct the network of Su et al. 2017.
+
+    If overrides is a list of dictionaries, a list of networks is returned
+    instead, one per entry. Each entry maps keyword arguments of this
+    function to (partial) replacements, e.g.
+        {'conductance_dict': {('EIP', 'PEI'): 11},
+         'input_neurons': {'rot_CW': {'freq': 50}}}
+    The networks share their connectivity and can be compiled together
+    as the replicas of a single ArrayNetwork.
+
+    With cache the network is loaded from, or saved to, CACHE_DIR, see
+    the module docstring.
+    '''
+    params = locals().copy()
+    del params['overrides'], params['cache']
+    if overrides is not None:
+        return [get_fruit_fly_network(**_merge_params(params, override),
+                                      cache=cache)
+                for override in overrides]
+
+    if not cache:
+        return _build_network(**params)
+    path = os.path.join(CACHE_DIR, f'fruit_fly_{_cache_key(params)}.npz')
+    if os.path.exists(path):
+        os.utime(path)  # mark as recently used
+        return load_topology(path)
+    net = _build_network(**params)
+    try:
+        save_topology(path, net)
+        _evict_topologies()
+    except OSError:
+        pass  # a read only cache only costs the rebuild
+    return net
+
+
+def _cache_key(params: dict) -> str:
+    digest = hashlib.sha256(__version__.encode())
+    # the builder code as well as its inputs
+    for file_name in [__file__, 'topology.py', *_TABLES.values()]:
+        with open(os.path.join(PATH, file_name), 'rb') as f:
+            digest.update(f.read())
+    digest.update(repr(sorted(params.items())).encode())
+    return digest.hexdigest()[:16]
+
+
+def _evict_topologies():
+    '''Remove all but the TOPOLOGY_CACHE_SIZE most recently used cached
+    networks.'''
+    paths = [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR)
+             if name.startswith('fruit_fly_') and name.endswith('.npz')]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[TOPOLOGY_CACHE_SIZE:]:
+        os.remove(path)
+
+
+def _build_network(**params):
     net = Network()
+    connections = []
+    EB_table, PB_table = (_read_table(file_name)
+                          for file_name in _TABLES.values())
+    add_ring(net, connections, EB_table, PB_table, **params)
+    net.add_synapses(connections)
+    return net
+
+
+def add_ring(net: Network,
+             connections: list,
+             EB_table,
+             PB_table,
+             EIP_params,
+             PEI_params,
+             PEN_params,
+             REIP_params,
+             RPEI_params,
+             RPEN_params,
+             GABAA_params,
+             acetylcholine_params,
+             NMDA_params,
+             conductance_dict,
+             input_neurons,
+             input_synapse_conductance,
+             prefix: str = ''):
+    '''Add the clusters of one ring to net, and append its connections
+    to connections, for net.add_synapses.
+
+    The tables are the (index, columns, values) of the EB and PB
+    innervation, as read from the csv files, with values dense or a
+    scipy.sparse matrix: 1 where a cluster is postsynaptic in a region
+    and 2 where it is presynaptic. Both share the index of EIP, PEI and
+    PEN clusters, the first half of the PEN clusters receives rot_CW and
+    the second rot_CCW. Every name is prefixed with prefix, so several
+    rings can share a network. The work is linear in the number of
+    synapses.'''
+    # imported here, so that the constants of this module are available
+    # without the slow import of scipy
+    import scipy.sparse as sp
+
+    def name(label):
+        return prefix + label
+
+    index, regions, _ = EB_table
+    assert tuple(PB_table[0]) == tuple(index), \
+        'The EB and PB tables must share their index.'
+    kinds = [label[:3] for label in index]
+    neuron_params = {'EIP': EIP_params, 'PEI': PEI_params,
+                     'PEN': PEN_params}
+    PEN_labels = [label for label in index if label[:3] == 'PEN']
 
     net.add_neurons(
-        *(NeuronCluster(name, **EIP_params) for name in EIP_LABELS),
-        *(NeuronCluster(name, **PEI_params) for name in PEI_LABELS),
-        *(NeuronCluster(name, **PEN_params) for name in PEN_LABELS),
-        NeuronCluster('RPEN', **RPEN_params),
-        NeuronCluster('RPEI', **RPEI_params),
-        NeuronCluster('REIP', **REIP_params),
-        *(InputNeuronCluster(key, **params)
+        *(NeuronCluster(name(label), **neuron_params[kind])
+          for label, kind in zip(index, kinds)),
+        NeuronCluster(name('RPEN'), **RPEN_params),
+        NeuronCluster(name('RPEI'), **RPEI_params),
+        NeuronCluster(name('REIP'), **REIP_params),
+        *(InputNeuronCluster(name(key), **params)
           for key, params in input_neurons.items())
     )
 
     # EIP, PEI, PEN connections
-    for table in [EB_INNERVATION, PB_INNERVATION]:
-        for src, trg in product(table.index, table.index):
-            overlaps = sum(
-                (table.loc[src] == 2) &
-                (table.loc[trg] == 1))
-            if overlaps == 0:  # no connections
-                continue
-            # if src[:3] == 'PEN' and trg in ['EIP0', 'EIP17']:
-            #     overlaps = 3  # asterix in sup table 3
-            factor = conductance_dict[(src[:3], trg[:3])]
-            net.add_synapse(
-                src,
-                trg,
+    for _, _, values in (EB_table, PB_table):
+        values = sp.csr_matrix(values)
+        # overlaps[i, j] counts the regions where cluster i is
+        # presynaptic and cluster j postsynaptic
+        overlaps = (values == 2).astype(int) @ (values == 1).astype(int).T
+        overlaps = sp.csr_matrix(overlaps)
+        overlaps.sort_indices()
+        # if src[:3] == 'PEN' and trg in ['EIP0', 'EIP17']:
+        #     overlaps = 3  # asterix in sup table 3
+        rows = np.repeat(np.arange(len(index)), np.diff(overlaps.indptr))
+        for i, j, overlap in zip(rows.tolist(), overlaps.indices.tolist(),
+                                 overlaps.data.tolist()):
+            factor = conductance_dict[(kinds[i], kinds[j])]
+            connections.append((
+                name(index[i]),
+                name(index[j]),
                 NMDASynapseCluster(
-                    max_conductance=overlaps * factor,
-                    **NMDA_params))
+                    max_conductance=overlap * factor,
+                    **NMDA_params)))
 
     # EIP and REIP connections
-    for name in EIP_LABELS:
-        net.add_synapse(name,
-                        'REIP',
-                        NMDASynapseCluster(
-                            max_conductance=conductance_dict[('EIP', 'REIP')],
-                            **NMDA_params))
-        net.add_synapse('REIP',
-                        name,
-                        NMDASynapseCluster(
-                            max_conductance=conductance_dict[('REIP', 'EIP')],
-                            **GABAA_params))
-
-    net.add_synapse('REIP',
-                    'REIP',
-                    SynapseCluster(
-                        max_conductance=conductance_dict[('REIP', 'REIP')],
-                        **GABAA_params))
+    for label in index:
+        if label[:3] != 'EIP':
+            continue
+        connections.append((
+            name(label),
+            name('REIP'),
+            NMDASynapseCluster(
+                max_conductance=conductance_dict[('EIP', 'REIP')],
+                **NMDA_params)))
+        connections.append((
+            name('REIP'),
+            name(label),
+            NMDASynapseCluster(
+                max_conductance=conductance_dict[('REIP', 'EIP')],
+                **GABAA_params)))
+
+    connections.append((
+        name('REIP'),
+        name('REIP'),
+        SynapseCluster(
+            max_conductance=conductance_dict[('REIP', 'REIP')],
+            **GABAA_params)))
 
     # PEI and RPEI connections
-    for name in PEI_LABELS:
-        net.add_synapse('RPEI', name,
-                        SynapseCluster(
-                            max_conductance=conductance_dict[('RPEI', 'PEI')],
-                            **GABAA_params))
+    for label in index:
+        if label[:3] != 'PEI':
+            continue
+        connections.append((
+            name('RPEI'), name(label),
+            SynapseCluster(
+                max_conductance=conductance_dict[('RPEI', 'PEI')],
+                **GABAA_params)))
 
     # PEN and RPEN connections
-    for name in PEN_LABELS:
-        net.add_synapse('RPEN', name,
-                        SynapseCluster(
-                            max_conductance=conductance_dict[('RPEN', 'PEN')],
-                            **GABAA_params))
+    for label in PEN_labels:
+        connections.append((
+            name('RPEN'), name(label),
+            SynapseCluster(
+                max_conductance=conductance_dict[('RPEN', 'PEN')],
+                **GABAA_params)))
 
     # input connections
-    for region in EB_INNERVATION.columns:
-        for trg in EB_INNERVATION.loc[EB_INNERVATION[region] == 2].index:
-            net.add_synapse(
-                region+'_input',
-                trg,
+    presynaptic = sp.csc_matrix(sp.csr_matrix(EB_table[2]) == 2)
+    presynaptic.sort_indices()
+    for column, region in enumerate(regions):
+        rows = presynaptic.indices[presynaptic.indptr[column]:
+                                   presynaptic.indptr[column+1]]
+        for trg in rows.tolist():
+            connections.append((
+                name(region+'_input'),
+                name(index[trg]),
                 SynapseCluster(
                     max_conductance=input_synapse_conductance[region+'_input'],
-                    **acetylcholine_params))
+                    **acetylcholine_params)))
 
-    net.add_synapse(
-        'RPEN_input',
-        'RPEN',
+    connections.append((
+        name('RPEN_input'),
+        name('RPEN'),
         SynapseCluster(
             max_conductance=input_synapse_conductance['RPEN_input'],
-            **acetylcholine_params))
+            **acetylcholine_params)))
 
-    net.add_synapse(
-        'RPEI_input',
-        'RPEI',
+    connections.append((
+        name('RPEI_input'),
+        name('RPEI'),
         SynapseCluster(
             max_conductance=input_synapse_conductance['RPEI_input'],
-            **acetylcholine_params))
+            **acetylcholine_params)))
 
-    for trg in [f'PEN{num}' for num in range(8)]:
-        net.add_synapse(
-            'rot_CW',
-            trg,
+    for trg in PEN_labels[:len(PEN_labels)//2]:
+        connections.append((
+            name('rot_CW'),
+            name(trg),
             SynapseCluster(
                 max_conductance=input_synapse_conductance['rot_CW'],
-                **acetylcholine_params))
+                **acetylcholine_params)))
 
-    for trg in [f'PEN{num}' for num in range(8, 16)]:
-        net.add_synapse(
-            'rot_CCW',
-            trg,
+    for trg in PEN_labels[len(PEN_labels)//2:]:
+        connections.append((
+            name('rot_CCW'),
+            name(trg),
             SynapseCluster(
                 max_conductance=input_synapse_conductance['rot_CCW'],
-                **acetylcholine_params))
-
-    return net
+                **acetylcholine_params)))
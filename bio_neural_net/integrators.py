@@ -0,0 +1,40 @@
+'''Membrane potential integrators.
+
+Within a step the synaptic conductances are held constant, so the
+membrane equation
+    Cm dV/dt = -gL (V - VL) - sum_j g_j (V - E_j)
+is linear in V with the rate (gL + sum_j g_j)/Cm. An integrator takes the
+potential V, the right hand side rhs = dV/dt at V, this rate and the step
+size dt and returns the next potential. They work on floats and arrays.
+
+Neither integrator is as accurate at steps above the default 1e-4 s.
+integrator_accuracy.py compares the spike counts of the first 2 s of
+sim2 with those of forward Euler at 1e-5 s. The relative errors are
+    dt       euler    exponential
+    1e-4     1.4%     3.3%
+    2e-4     2.7%     6.4%
+    5e-4     351%     12.6%
+    1e-3     335%     36.5%
+The exponential integrator only keeps larger steps stable, and exact
+event driven synapses give about the same errors. Keep dt at 1e-4 s where
+accuracy matters.
+'''
+import numpy as np
+
+
+def forward_euler(V, rhs, rate, dt):
+    return V + rhs*dt
+
+
+def exponential_euler(V, rhs, rate, dt):
+    '''Integrate the linear membrane equation exactly over the step.
+    This stays stable for step sizes well above the membrane time
+    constant 1/rate, where forward Euler diverges. It is not more
+    accurate, see the module docstring.'''
+    return V - rhs*np.expm1(-rate*dt)/rate
+
+
+INTEGRATORS = {
+    'euler': forward_euler,
+    'exponential': exponential_euler
+}
@@ -0,0 +1,295 @@
+'''Live views of running simulations.
+
+The simulation and the plots are decoupled. A LiveFeed is passed as the
+callback of an engine's run method and, every `every` steps, only copies
+the probe samples and spikes since its previous call into ring buffers
+in shared memory. It never waits for a viewer and costs the same whether
+one is attached or not. A LiveView draws the latest contents of the ring
+buffers at a fixed frame rate in a process of its own, so drawing does
+not compete with the simulation for the interpreter.
+
+The ring buffers have a single writer, the simulation, and any number of
+readers. The writer never blocks: it bumps a sequence number before and
+after each write, and readers retry a copy that overlapped a write.
+
+Example
+    voltages = engine.probe('V', ['n1'], stride=100)
+    feed = LiveFeed({'voltage': voltages}, ['n1', 'n2'],
+                    capacity=10_000, spike_capacity=100_000)
+    LiveView(feed, window=0.05).run(engine, steps, every=1000)
+'''
+import multiprocessing
+import time
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+_SEQ, _COUNT, _CLOSED = range(3)
+_HEADER = 3  # int64 fields in front of the rows
+
+
+class RingBuffer:
+    '''The latest capacity float rows of shape row_shape pushed to it,
+    in shared memory. Pass the spec() of a buffer to attach to it from
+    another process.'''
+    def __init__(self, capacity: int, row_shape=(), name: str = None):
+        self.capacity = capacity
+        self.row_shape = tuple(row_shape)
+        size = 8*(_HEADER + capacity*int(np.prod(self.row_shape)))
+        self.owner = name is None
+        self.shm = SharedMemory(name=name, create=self.owner, size=size)
+        self._header = np.ndarray(_HEADER, dtype=np.int64,
+                                  buffer=self.shm.buf)
+        self.data = np.ndarray((capacity, *self.row_shape), dtype=float,
+                               buffer=self.shm.buf, offset=8*_HEADER)
+        if self.owner:
+            self._header[:] = 0
+
+    def spec(self):
+        return self.capacity, self.row_shape, self.shm.name
+
+    @property
+    def count(self) -> int:
+        '''The number of rows pushed in total.'''
+        return int(self._header[_COUNT])
+
+    @property
+    def closed(self) -> bool:
+        '''Whether the writer is done.'''
+        return bool(self._header[_CLOSED])
+
+    def push(self, rows):
+        rows = np.asarray(rows)
+        total = self.count + len(rows)
+        rows = rows[-self.capacity:]
+        slots = np.arange(total - len(rows), total) % self.capacity
+        self._header[_SEQ] += 1  # odd while writing
+        self.data[slots] = rows
+        self._header[_COUNT] = total
+        self._header[_SEQ] += 1
+
+    def close_writer(self):
+        self._header[_CLOSED] = 1
+
+    def latest(self, retries: int = 100):
+        '''A copy of the rows in the buffer, oldest first.'''
+        for _ in range(retries):
+            seq = int(self._header[_SEQ])
+            if seq % 2 == 0:
+                count = self.count
+                first = max(count - self.capacity, 0)
+                rows = self.data[np.arange(first, count) % self.capacity]
+                if self._header[_SEQ] == seq:
+                    return rows
+            time.sleep(0)
+        raise RuntimeError('The ring buffer is written to continuously.')
+
+    def release(self):
+        '''Detach, and free the memory if this buffer created it.'''
+        del self._header, self.data
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def __str__(self):
+        return f'RingBuffer: {len(self)} of {self.capacity} rows'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
+
+
+class LiveFeed:
+    '''Copies the new samples of probes, a dict of name: Probe, and the
+    spikes of the clusters spikes into ring buffers. Probe rows are
+    (time, values...) of replica 0 and spike rows (time, index into
+    spikes).'''
+    def __init__(self, probes: dict, spikes: list,
+                 capacity: int = 10_000, spike_capacity: int = 100_000):
+        self.probes = dict(probes)
+        self.spikes = list(spikes)
+        self.buffers = {
+            name: RingBuffer(capacity, (1 + len(probe.targets),))
+            for name, probe in self.probes.items()}
+        self.spike_buffer = RingBuffer(spike_capacity, (2,))
+        self._probe_counts = {name: 0 for name in self.probes}
+        self._engine = None
+        self._position = 0
+
+    def layout(self) -> dict:
+        '''What a viewer needs to attach to the buffers.'''
+        return {
+            'probes': {name: (list(map(str, probe.targets)),
+                              self.buffers[name].spec())
+                       for name, probe in self.probes.items()},
+            'spikes': (self.spikes, self.spike_buffer.spec())
+        }
+
+    def _bind(self, engine):
+        self._engine = engine
+        names = engine.names if hasattr(engine, 'names') \
+            else list(engine.neurons.keys())
+        # index into spikes of every cluster, -1 for those not shown
+        self._index = np.full(len(names), -1)
+        for i, name in enumerate(self.spikes):
+            self._index[names.index(name)] = i
+        self._position = 0 if hasattr(engine, 'recorder') \
+            else np.zeros(len(names), dtype=int)
+
+    def _new_spikes(self, engine):
+        '''The (cluster indices, times) of the spikes since the last
+        call.'''
+        if hasattr(engine, 'recorder'):
+            rows = engine.recorder.table(self._position)
+            self._position += len(rows)
+            first = rows[:, 0] < len(self._index)  # replica 0
+            return rows[first, 0], \
+                engine.start_time + rows[first, 1]*engine.dt
+        # the object model records spikes on the clusters
+        ids, times = [], []
+        for i, neuron in enumerate(engine.neurons.values()):
+            new = neuron.firing_times[self._position[i]:]
+            ids += [i]*len(new)
+            times += new
+            self._position[i] += len(new)
+        return np.array(ids, dtype=int), np.array(times)
+
+    def __call__(self, engine) -> bool:
+        '''Push the new data. Never stops the run.'''
+        if engine is not self._engine:
+            self._bind(engine)
+        for name, probe in self.probes.items():
+            time_indices, values = probe.since(self._probe_counts[name])
+            self._probe_counts[name] = probe.count
+            if len(time_indices):
+                values = values.reshape(len(values), -1,
+                                        len(probe.targets))[:, 0]
+                self.buffers[name].push(np.column_stack([
+                    probe.start_time + time_indices*probe.dt, values]))
+        ids, times = self._new_spikes(engine)
+        shown = self._index[ids] >= 0
+        if shown.any():
+            self.spike_buffer.push(
+                    np.column_stack([times[shown], self._index[ids[shown]]]))
+        return False
+
+    def finish(self):
+        '''Tell viewers no more data will come.'''
+        self.spike_buffer.close_writer()
+
+    def release(self):
+        for buffer in [*self.buffers.values(), self.spike_buffer]:
+            buffer.release()
+
+    def __str__(self):
+        return f'LiveFeed: {len(self.probes)} probes, ' + \
+               f'{self.spike_buffer.count} spikes'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
+
+
+def _view(layout: dict, window: float, fps: float, ylims: dict,
+          block: bool):
+    '''Draw the buffers of layout until their writer is done.'''
+    import matplotlib.pyplot as plt
+    probes = {name: (targets, RingBuffer(*spec))
+              for name, (targets, spec) in layout['probes'].items()}
+    labels, spec = layout['spikes']
+    spike_buffer = RingBuffer(*spec)
+
+    plt.ion()
+    fig, axes = plt.subplots(1 + len(probes), 1, figsize=(15, 15),
+                             sharex=True, squeeze=False)
+    axes = axes[:, 0]
+    spike_axis = axes[0]
+    spike_line, = spike_axis.plot([], [], 'k.', markersize=2)
+    spike_axis.set_yticks(range(len(labels)))
+    spike_axis.set_yticklabels(labels)
+    spike_axis.set_ylim(-1, len(labels))
+    spike_axis.set_ylabel('spikes')
+    lines = {}
+    for axis, (name, (targets, _)) in zip(axes[1:], probes.items()):
+        lines[name] = [axis.plot([], [], label=target)[0]
+                       for target in targets]
+        axis.set_ylabel(name)
+        if name in ylims:
+            axis.set_ylim(*ylims[name])
+        axis.legend(loc='upper right')
+    axes[-1].set_xlabel('t (s)')
+
+    while True:
+        closed = spike_buffer.closed
+        spikes = spike_buffer.latest()
+        spike_line.set_data(spikes[:, 0], spikes[:, 1])
+        start = spikes[0, 0] if len(spikes) else np.inf
+        end = spikes[-1, 0] if len(spikes) else -np.inf
+        for name, (_, buffer) in probes.items():
+            rows = buffer.latest()
+            for column, line in enumerate(lines[name], start=1):
+                line.set_data(rows[:, 0], rows[:, column])
+            if len(rows):
+                start = min(start, rows[0, 0])
+                end = max(end, rows[-1, 0])
+                if name not in ylims:
+                    axis = lines[name][0].axes
+                    axis.relim()
+                    axis.autoscale_view(scalex=False)
+        if end > start:
+            if window is not None:
+                start = max(start, end - window)
+            spike_axis.set_xlim(start, end)
+        fig.canvas.draw_idle()
+        if closed:
+            break
+        plt.pause(1/fps)
+
+    plt.ioff()
+    if block:
+        plt.show()
+    for _, buffer in probes.values():
+        buffer.release()
+    spike_buffer.release()
+
+
+class LiveView:
+    '''A matplotlib figure, drawn in a separate process, with a raster of
+    the spikes of a LiveFeed and one axis per probe, showing the last
+    window seconds (or all data in the buffers), redrawn fps times per
+    second. ylims fixes the y range of probes by name.'''
+    def __init__(self, feed: LiveFeed, window: float = None,
+                 fps: float = 20.0, ylims: dict = None, block: bool = True):
+        self.feed = feed
+        self.window = window
+        self.fps = fps
+        self.ylims = dict(ylims or {})
+        self.block = block
+        self.process = None
+
+    def start(self):
+        self.process = multiprocessing.Process(
+                target=_view,
+                args=(self.feed.layout(), self.window, self.fps, self.ylims,
+                      self.block))
+        self.process.start()
+
+    def run(self, engine, n_steps: int = None, every: int = 1000):
+        '''Simulate, feeding the view, and wait for the figure to be
+        closed. Returns the number of steps taken.'''
+        if self.process is None:
+            self.start()
+        try:
+            steps = engine.run(n_steps, callback=self.feed, every=every)
+        finally:
+            self.feed.finish()
+            self.process.join()
+            self.feed.release()
+        return steps
+
+    def __str__(self):
+        return f'LiveView: {len(self.feed.probes)} probes at {self.fps} fps'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
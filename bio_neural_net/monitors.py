@@ -0,0 +1,216 @@
+'''Monitors aborting simulations that are going nowhere.
+
+A Supervisor is passed as the callback of an engine's run method and is
+called every `every` steps. It counts the spikes of every cluster since
+its last call, from the spikes recorded in the meantime only, and hands
+the counts of this window to its monitors. Each monitor returns the
+replicas it wants to abort. Aborted replicas are dropped from an
+ArrayNetwork, which keeps simulating the others, and the run stops once
+no replica is left. The supervisor keeps the reason and time index of
+every abort.
+
+Example
+    supervisor = Supervisor([SilenceMonitor('EIP', after=0.5),
+                             SaturationMonitor('EIP')])
+    engine.run(steps, callback=supervisor, every=1000)
+    supervisor.aborted  # {replica: (time_index, reason)}
+'''
+from abc import ABC, abstractmethod
+from inspect import signature
+
+import numpy as np
+
+SILENT = 'silent'
+SATURATED = 'saturated'
+WIDE_BUMP = 'wide bump'
+
+
+def _select(names, clusters):
+    '''The indices of the clusters, given as a list of names or as a
+    prefix such as 'EIP'.'''
+    if isinstance(clusters, str):
+        return [i for i, name in enumerate(names)
+                if name.startswith(clusters)]
+    index = {name: i for i, name in enumerate(names)}
+    return [index[name] for name in clusters]
+
+
+class Monitor(ABC):
+    '''Base class of monitors. check receives the spike counts of the
+    window, of shape (replicas, clusters), and its duration in seconds
+    and returns a boolean mask of the replicas to abort. Monitors are
+    only consulted once the simulation time reaches after.'''
+    reason = None
+
+    def __init__(self, clusters='EIP', after: float = 0.0):
+        self.clusters = clusters
+        self.after = after
+        self.index = None
+
+    def bind(self, names):
+        self.index = _select(names, self.clusters)
+
+    @abstractmethod
+    def check(self, counts, duration: float):
+        pass
+
+    def spec(self) -> dict:
+        '''The type and the parameters of the monitor, which tell
+        whether two monitors judge runs the same way.'''
+        spec = {'type': type(self).__name__}
+        for name in signature(type(self).__init__).parameters:
+            if name != 'self':
+                value = getattr(self, name)
+                if hasattr(value, 'toarray'):
+                    value = value.toarray()
+                if isinstance(value, np.ndarray):
+                    value = value.tolist()
+                spec[name] = repr(value)
+        return spec
+
+    def __str__(self):
+        return f'{type(self).__name__}: {self.clusters} after {self.after}s'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
+
+
+class SilenceMonitor(Monitor):
+    '''Aborts when the mean firing rate of the clusters drops below
+    min_rate (Hz).'''
+    reason = SILENT
+
+    def __init__(self, clusters='EIP', min_rate: float = 1.0,
+                 after: float = 0.0):
+        super().__init__(clusters, after)
+        self.min_rate = min_rate
+
+    def check(self, counts, duration: float):
+        rates = counts[:, self.index].mean(axis=1)/duration
+        return rates < self.min_rate
+
+
+class SaturationMonitor(Monitor):
+    '''Aborts when at least a fraction of the clusters fire faster than
+    max_rate (Hz), i.e. the whole population is active.'''
+    reason = SATURATED
+
+    def __init__(self, clusters='EIP', max_rate: float = 100.0,
+                 fraction: float = 0.9, after: float = 0.0):
+        super().__init__(clusters, after)
+        self.max_rate = max_rate
+        self.fraction = fraction
+
+    def check(self, counts, duration: float):
+        active = counts[:, self.index]/duration > self.max_rate
+        return active.mean(axis=1) >= self.fraction
+
+
+class BumpWidthMonitor(Monitor):
+    '''Aborts when the activity bump spreads over more than max_width
+    regions. The spikes are summed per region with the sparse (regions,
+    clusters) matrix regions, see rates.region_matrix, by default over
+    the EB regions. A region is part of the bump if its count is at
+    least half of the largest one. Windows with fewer than min_spikes
+    spikes are not judged.'''
+    reason = WIDE_BUMP
+
+    def __init__(self, max_width: int = 8, regions=None,
+                 min_spikes: int = 10, after: float = 0.0):
+        super().__init__(None, after)
+        self.max_width = max_width
+        self.regions = regions
+        self.min_spikes = min_spikes
+        self._regions = regions
+
+    def bind(self, names):
+        if self.regions is None:
+            from .fruit_fly_network import EB_INNERVATION
+            from .rates import region_matrix
+            self._regions = region_matrix(EB_INNERVATION, names)
+
+    def check(self, counts, duration: float):
+        region_counts = (self._regions @ counts.T).T
+        peak = region_counts.max(axis=1, keepdims=True)
+        width = (region_counts >= peak/2).sum(axis=1)
+        return (width > self.max_width) & \
+            (region_counts.sum(axis=1) >= self.min_spikes)
+
+    def __str__(self):
+        return f'BumpWidthMonitor: at most {self.max_width} regions ' + \
+               f'after {self.after}s'
+
+
+class Supervisor:
+    '''Runs monitors on the spike counts of the windows between its
+    calls, see the module docstring.'''
+    def __init__(self, monitors):
+        self.monitors = list(monitors)
+        self.aborted = {}
+        self._engine = None
+        self._position = 0
+        self._last_index = 0
+
+    def _bind(self, engine):
+        self._engine = engine
+        for monitor in self.monitors:
+            monitor.bind(engine.names if hasattr(engine, 'names')
+                         else list(engine.neurons.keys()))
+        self._position = 0
+        self._last_index = 0
+        self.aborted = {}
+
+    def _window_counts(self, engine):
+        '''The spike counts since the last call, (replicas, clusters).'''
+        if hasattr(engine, 'recorder'):
+            recorder = engine.recorder
+            rows = recorder.table(self._position)
+            self._position += len(rows)
+            return np.bincount(rows[:, 0], minlength=recorder.num_ids
+                               ).reshape(recorder.replicas, -1)
+        # the object model records spikes on the clusters
+        neurons = list(engine.neurons.values())
+        totals = np.array([[len(neuron.firing_time_indices)
+                            for neuron in neurons]])
+        counts = totals - self._position
+        self._position = totals
+        return counts
+
+    def __call__(self, engine) -> bool:
+        '''Check the monitors, returning True once no replica is left.'''
+        if engine is not self._engine or \
+                engine.time_index < self._last_index:
+            self._bind(engine)
+        counts = self._window_counts(engine)
+        duration = (engine.time_index - self._last_index)*engine.dt
+        self._last_index = engine.time_index
+        time = engine.start_time + engine.time_index*engine.dt
+        if duration <= 0:
+            return False
+
+        replica_ids = getattr(engine, 'replica_ids', np.arange(1))
+        abort = []
+        for monitor in self.monitors:
+            if time < monitor.after:
+                continue
+            mask = monitor.check(counts[replica_ids], duration)
+            for replica in replica_ids[mask]:
+                replica = int(replica)
+                if replica not in self.aborted:
+                    self.aborted[replica] = (engine.time_index,
+                                             monitor.reason)
+                    abort.append(replica)
+        if abort and len(abort) < len(replica_ids):
+            engine.drop_replicas(abort)
+        return len(abort) == len(replica_ids)
+
+    def reason(self, replica: int = 0):
+        '''The reason replica was aborted, or None.'''
+        return self.aborted.get(replica, (None, None))[1]
+
+    def __str__(self):
+        return f'Supervisor: {len(self.monitors)} monitors, ' + \
+               f'{len(self.aborted)} aborted'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
@@ -1,6 +1,14 @@
 
-from .neuron import NeuronCluster, InputNeuronCluster
-from .synapse import SynapseCluster
+import copy
+
+import numpy as np
+
+from .neuron import InputNeuronCluster, NeuronCluster
+from .synapse import ReceptorCluster, SynapseCluster
+from .integrators import INTEGRATORS
+from .probes import Probe
+from .state import pack_state, unpack_state
+from .stepping import run_in_blocks
 
 class Network:
     def __init__(self):
@@ -13,12 +21,42 @@ class Network:
 
         self.neurons = {}
         self.synapses = {}
+        # the output synapses of each neuron keyed by themselves, so that
+        # equal synapses are found by hashing instead of a linear scan
+        self._outputs = {}
+        # synapses merged into receptors by aggregate_receptors
+        self._aggregated = set()
+        self.probes = []
+
+        self.event_synapses = False
+        self.integrator = INTEGRATORS['euler']
 
     def set_time_params(self, start_time: float, dt: float, num_steps: int):
         self.start_time = start_time
         self.dt = dt
         self.num_steps = num_steps
 
+    def set_event_synapses(self, event_synapses: bool = True):
+        '''Switch between forward Euler synapses, updated on every step,
+        and event driven synapses that decay exactly and are only updated
+        when their presynaptic cluster fires.
+
+        This makes the synapses exact, not this model faster: every
+        cluster still reads, and decays, each of its input synapses on
+        every step, so a step costs O(synapses) as before and about as
+        much as with Euler synapses. The cost per spike is only reached
+        by EventNetwork.'''
+        self.event_synapses = event_synapses
+
+    def set_integrator(self, integrator):
+        '''Choose the membrane potential integrator, either by name from
+        INTEGRATORS or as a function with the same signature.'''
+        if isinstance(integrator, str):
+            assert integrator in INTEGRATORS, \
+                f'Unknown integrator {integrator}.'
+            integrator = INTEGRATORS[integrator]
+        self.integrator = integrator
+
     def add_neurons(self, *args):
         for arg in args:
             assert isinstance(arg, NeuronCluster)
@@ -32,31 +70,182 @@ class Network:
 
         assert pre in self.neurons.keys()
         assert post in self.neurons.keys()
+        self._add_synapse(pre, post, syn)
+
+    def add_synapses(self, connections):
+        '''Add many (pre, post, synapse) connections at once.'''
+        connections = list(connections)
+        names = {pre for pre, _, _ in connections} | \
+            {post for _, post, _ in connections}
+        assert names <= self.neurons.keys(), \
+            f'Unknown neurons {names - self.neurons.keys()}.'
+        for pre, post, syn in connections:
+            self._add_synapse(pre, post, syn)
+
+    def _add_synapse(self, pre: str, post: str, syn: SynapseCluster):
         name = (pre, post)
         assert name not in self.synapses.keys()
 
         # if the presynaptic neuron already has one of this
         # type, we'll just reuse it.
-        for syn2 in self[pre].outputs:
-            if syn == syn2:
-                self[post].inputs.append(syn2)
-                self.synapses[name] = syn2
-                return
+        outputs = self._outputs.setdefault(pre, {})
+        if syn in outputs:
+            syn2 = outputs[syn]
+            self[post].inputs.append(syn2)
+            self.synapses[name] = syn2
+            return
 
+        outputs[syn] = syn
         self[pre].outputs.append(syn)
         self[post].inputs.append(syn)
         self.synapses[name] = syn
 
         syn.pre_size = self[pre].size
 
+    def aggregate_receptors(self):
+        '''Merge the linear (non NMDA) synapses onto each cluster that
+        share a time constant and reversal potential into a single
+        ReceptorCluster holding their summed conductance, so each
+        cluster updates and sums one state per receptor type instead of
+        one per incoming synapse.
+
+        The merged synapses stay in self.synapses, and are what compile()
+        uses, but are no longer updated by this network and cannot be
+        probed. Synapses added later are not merged.'''
+        receptors = {}
+        for (pre, post), syn in self.synapses.items():
+            if type(syn) is not SynapseCluster or \
+                    (pre, post) in self._aggregated:
+                continue
+            key = (post, syn.time_constant, syn.reversal_potential)
+            if key not in receptors:
+                receptors[key] = ReceptorCluster(syn.time_constant,
+                                                 syn.reversal_potential)
+                self[post].receptors.append(receptors[key])
+                self[post].inputs.append(receptors[key])
+            receptors[key].num_sources += 1
+            self[pre].receptor_outputs.append(
+                    (receptors[key], syn.max_conductance*syn.pre_size))
+            self._aggregated.add((pre, post))
+
+        merged = {id(self.synapses[key]) for key in self._aggregated}
+        for neuron in self.neurons.values():
+            neuron.outputs = [syn for syn in neuron.outputs
+                              if id(syn) not in merged]
+            if hasattr(neuron, 'inputs'):
+                neuron.inputs = [syn for syn in neuron.inputs
+                                 if id(syn) not in merged]
+        for outputs in self._outputs.values():
+            for syn in list(outputs):
+                if id(syn) in merged:
+                    del outputs[syn]
+
     def reset(self):
         assert self.start_time is not None
         self.time = self.start_time
         self.time_index = 0
         for neuron in self.neurons.values():
-            if isinstance(neuron, InputNeuronCluster):
-                neuron.set_sim_params(self.start_time, self.dt)
+            neuron.set_sim_params(self.start_time, self.dt)
+            neuron.event_synapses = self.event_synapses
+            neuron.integrator = self.integrator
             neuron.reset()
+        for probe in self.probes:
+            probe.reset(self.start_time, self.dt, self.num_steps)
+            probe.sample(self.time_index)
+
+    def _stateful_synapses(self):
+        '''The synapses and receptors updated by this network.'''
+        neurons = self.neurons.values()
+        syns = [syn for neuron in neurons for syn in neuron.outputs]
+        receptors = [receptor for neuron in neurons
+                     for receptor in getattr(neuron, 'receptors', [])]
+        return syns, receptors
+
+    def snapshot(self) -> bytes:
+        '''The state of the simulation, potentials, firing flags,
+        synapses and the recorded spikes, as a compact blob for restore.
+        Probes are not included.'''
+        assert self.time_index is not None, 'The network has not been reset.'
+        neurons = list(self.neurons.values())
+        syns, receptors = self._stateful_synapses()
+        spikes = [neuron.firing_time_indices for neuron in neurons]
+        return pack_state(
+            'Network',
+            time_index=self.time_index,
+            V=[np.nan if isinstance(neuron, InputNeuronCluster)
+               else neuron.V for neuron in neurons],
+            firing=[bool(neuron.firing) for neuron in neurons],
+            gating=[syn.gating for syn in syns],
+            gating_index=[syn.gating_index for syn in syns],
+            receptor_gating=[receptor.gating for receptor in receptors],
+            receptor_pending=[receptor._pending for receptor in receptors],
+            spike_offsets=np.cumsum([0] + [len(s) for s in spikes]),
+            spike_indices=np.array(sum(spikes, []), dtype=int),
+            spike_times=np.array(sum((neuron.firing_times
+                                      for neuron in neurons), [])))
+
+    def restore(self, blob: bytes):
+        '''Reset the network and continue from a snapshot taken of this
+        network, or of one built the same way. Input spikes are
+        scheduled from the current intervals, which may differ from
+        those of the snapshot.'''
+        state = unpack_state(blob, 'Network')
+        self.reset()
+        self.time_index = int(state['time_index'])
+        self.time = self.start_time + self.time_index * self.dt
+
+        offsets = state['spike_offsets']
+        for i, neuron in enumerate(self.neurons.values()):
+            neuron.firing = bool(state['firing'][i])
+            if isinstance(neuron, InputNeuronCluster):
+                neuron.seek(self.time_index)
+            else:
+                neuron.V = state['V'][i].item()
+            neuron.firing_time_indices = \
+                state['spike_indices'][offsets[i]:offsets[i+1]].tolist()
+            neuron.firing_times = \
+                state['spike_times'][offsets[i]:offsets[i+1]].tolist()
+
+        syns, receptors = self._stateful_synapses()
+        assert len(syns) == len(state['gating']) and \
+            len(receptors) == len(state['receptor_gating']), \
+            'The snapshot was taken of a different network.'
+        for syn, gating, index in zip(syns, state['gating'].tolist(),
+                                      state['gating_index'].tolist()):
+            syn.gating = gating
+            syn.gating_index = index
+        for receptor, gating, pending in zip(
+                receptors, state['receptor_gating'].tolist(),
+                state['receptor_pending'].tolist()):
+            receptor.gating = gating
+            receptor._pending = pending
+
+        for probe in self.probes:
+            probe.reset(self.start_time, self.dt, self.num_steps)
+            probe.sample(self.time_index)
+
+    def reschedule_inputs(self, names=None):
+        '''Recompute the input spikes after changing the intervals or
+        rates of the input clusters names, by default all of them, part
+        way through a run.'''
+        if names is None:
+            names = self.neurons.keys()
+        for neuron in (self[name] for name in names):
+            if isinstance(neuron, InputNeuronCluster):
+                neuron.spike_indices = neuron.compute_spike_indices(
+                        self.start_time, self.dt)
+                neuron.seek(self.time_index)
+
+    def fork(self):
+        '''An independent copy of this network in its current state, to
+        continue with a different protocol. Probes are not copied. Call
+        reschedule_inputs on the fork after changing its inputs.'''
+        probes, self.probes = self.probes, []
+        try:
+            clone = copy.deepcopy(self)
+        finally:
+            self.probes = probes
+        return clone
 
     def update(self):
         for neuron in self.neurons.values():
@@ -68,6 +257,18 @@ class Network:
         self.time_index += 1
         self.time = self.start_time + self.time_index * self.dt
 
+        for probe in self.probes:
+            probe.sample(self.time_index)
+
+    def advance(self, n_steps: int):
+        for _ in range(n_steps):
+            self.update()
+
+    def run(self, n_steps: int = None, callback=None, every: int = None):
+        '''Advance n_steps, calling callback(self) every `every` steps.
+        See run_in_blocks.'''
+        return run_in_blocks(self, n_steps, callback, every)
+
     def simulate(self):
         self.reset()
         yield self
@@ -75,6 +276,54 @@ class Network:
             self.update()
             yield self
 
+    def probe(self, quantity: str, targets: list, stride: int = 1,
+              capacity: int = None) -> Probe:
+        '''Record the potential 'V' of the named clusters, or the
+        'gating' or 'current' of the synapses named by (pre, post), every
+        stride steps. See Probe.'''
+        def gating(syn):
+            if self.event_synapses:
+                return syn.gating_at(self.time_index, self.dt)
+            return syn.gating
+
+        merged = self._aggregated.intersection(targets) \
+            if quantity != 'V' else set()
+        if merged:
+            raise ValueError(f'Cannot probe {merged.pop()}, it has been '
+                             'merged into a receptor.')
+        if quantity == 'V':
+            neurons = [self[name] for name in targets]
+
+            def read():
+                return [neuron.V for neuron in neurons]
+        elif quantity == 'gating':
+            syns = [self[key] for key in targets]
+
+            def read():
+                return [gating(syn) for syn in syns]
+        elif quantity == 'current':
+            syns = [(self[key], self[key[1]]) for key in targets]
+
+            def read():
+                return [syn.current(post.V, gating(syn))
+                        for syn, post in syns]
+        else:
+            raise ValueError(f'Cannot probe {quantity}.')
+        probe = Probe(read, quantity, targets, stride, capacity)
+        self.probes.append(probe)
+        if self.time_index is not None:
+            probe.reset(self.start_time, self.dt, self.num_steps)
+            probe.sample(self.time_index)
+        return probe
+
+    def compile(self) -> 'ArrayNetwork':
+        '''An array backed engine simulating this network. The
+        network itself is left untouched and serves as the reference
+        implementation.'''
+        # imported here, scipy.sparse is slow to import
+        from .array_network import ArrayNetwork
+        return ArrayNetwork(self)
+
     def __getitem__(self, key):
         '''Dictionary like access of neurons and synapses.'''
         if isinstance(key, tuple):
@@ -5,6 +5,9 @@ https://www.nature.com/articles/s41467-017-00191-6
 
 import numpy as np
 
+from .integrators import forward_euler
+from .synapse import NMDASynapseCluster
+
 class NeuronCluster:
     def __init__(self,
                  name: str,
@@ -23,40 +26,109 @@ class NeuronCluster:
         self.firing = False
         self.V = self.VL
 
+        self.sim_start = None
+        self.sim_dt = None
+
+        # time indices of the steps a spike occurred in, and the spike
+        # times. The compiled engines record into a SpikeRecorder instead.
         self.firing_time_indices = []
+        self.firing_times = []
         self.inputs = []
         self.outputs = []
+        # see Network.aggregate_receptors, the receptors of this cluster
+        # and the (receptor, weight) pairs it sends its spikes to
+        self.receptors = []
+        self.receptor_outputs = []
+
+        # see Network.set_event_synapses and Network.set_integrator
+        self.event_synapses = False
+        self._synapse_event = False
+        self.integrator = forward_euler
 
         self.reset()
 
+    def set_sim_params(self, sim_start: float, sim_dt: float):
+        self.sim_start = sim_start
+        self.sim_dt = sim_dt
+
+    def record_spike(self, time_index: int, time: float = None):
+        if time is None:
+            time = self.sim_start + time_index*self.sim_dt
+        self.firing_time_indices.append(time_index)
+        self.firing_times.append(time)
+
+    def synaptic_input(self, time_index: int, dt: float):
+        '''The total synaptic current and conductance.'''
+        current = 0
+        conductance = 0
+        mg_block = None  # evaluated once for all NMDA inputs
+        for syn in self.inputs:
+            if self.event_synapses:
+                gating = syn.gating_at(time_index, dt)
+            else:
+                gating = syn.gating
+            if isinstance(syn, NMDASynapseCluster):
+                if mg_block is None:
+                    mg_block = syn.mg_block(self.V)
+                g = syn.conductance(self.V, gating, mg_block)
+            else:
+                g = syn.conductance(self.V, gating)
+            current += g * (self.V - syn.reversal_potential)
+            conductance += g
+        return current, conductance
+
+    def compute_synapses(self, time_index: int, dt: float) -> None:
+        '''Update the output synapses. Event driven synapses are only
+        touched when this cluster fires.'''
+        self._synapse_event = self.firing
+        if not self.event_synapses:
+            for syn in self.outputs:
+                syn.compute_update(dt, self.firing)
+        elif self.firing:
+            for syn in self.outputs:
+                syn.compute_event(time_index, dt)
+
+    def store_synapses(self) -> None:
+        if not self.event_synapses or self._synapse_event:
+            for syn in self.outputs:
+                syn.store_update()
+
     def compute_update(self, time_index: int, dt: float) -> None:
-        '''Use forward Euler to compute the next time step.'''
+        '''Use the integrator (forward Euler by default) to compute the
+        next time step.'''
         # if self.name == 'RPEN':
         #     import ipdb; ipdb.set_trace()
-        current = sum(syn.current(self.V)
-                      for syn in self.inputs)
+        current, conductance = self.synaptic_input(time_index, dt)
         rhs = (-self.gL*(self.V - self.VL) - current)/self.Cm
-        self._update = self.V + rhs*dt
+        rate = (self.gL + conductance)/self.Cm
+        self._update = self.integrator(self.V, rhs, rate, dt)
         # update each synapse
-        for syn in self.outputs:
-            syn.compute_update(dt, self.firing)
+        self.compute_synapses(time_index, dt)
+        for receptor in self.receptors:
+            receptor.compute_receptor(dt, self.event_synapses)
         # check if firing
         self.firing = (self._update >= self.threshold)
         if self.firing:
             self._update = self.VL
-            self.firing_time_indices.append(time_index)
+            self.record_spike(time_index)
+            for receptor, weight in self.receptor_outputs:
+                receptor.receive(weight)
 
     def store_update(self) -> None:
         self.V = self._update
-        for syn in self.outputs:
-            syn.store_update()
+        self.store_synapses()
+        for receptor in self.receptors:
+            receptor.store_update()
 
     def reset(self):
         self.V = self.VL
         self.firing = False
-        self.firing_time_time_indices = []
+        self.firing_time_indices = []
+        self.firing_times = []
         for syn in self.outputs:
             syn.reset()
+        for receptor in self.receptors:
+            receptor.reset()
 
     def __str__(self):
         return f'{self.name} - size: {self.size}, ' + \
@@ -81,27 +153,92 @@ def artificial_spike_indices(sim_start: float,
     yield None
 
 
+def regular_spike_indices(sim_start: float,
+                          dt: float,
+                          freq: float,
+                          intervals) -> np.ndarray:
+    '''The spike indices of artificial_spike_indices as one array.'''
+    chunks = [np.zeros(0, dtype=int)]
+    for t0, tf in intervals:
+        num = round(freq*(tf-t0))
+        offset = freq*(t0 - sim_start)
+        relative_rate = freq*dt
+        # np.rint rounds halves to even, as round does
+        chunks.append(np.rint((offset + np.arange(num))/relative_rate))
+    return np.concatenate(chunks).astype(int)
+
+
+def poisson_spike_indices(sim_start: float,
+                          dt: float,
+                          freq: float,
+                          intervals,
+                          rng: 'np.random.Generator',
+                          rate=None,
+                          chunk_size: int = 1 << 16) -> np.ndarray:
+    '''The indices of the steps a Poisson process with rate freq, or
+    with the time dependent rate(t) (Hz, vectorized over t), fires in
+    during the intervals. At most one spike is drawn per step.'''
+    chunks = [np.zeros(0, dtype=int)]
+    for t0, tf in intervals:
+        # the tolerance keeps t0 = 0.1, dt = 1e-4 at step 1000, not 1001
+        first = int(np.ceil((t0 - sim_start)/dt - 1e-9))
+        last = int(np.ceil((tf - sim_start)/dt - 1e-9))
+        for start in range(first, last, chunk_size):
+            steps = np.arange(start, min(start + chunk_size, last))
+            if rate is None:
+                p = freq*dt
+            else:
+                p = np.asarray(rate(sim_start + steps*dt))*dt
+            chunks.append(steps[rng.random(len(steps)) < p])
+    return np.concatenate(chunks)
+
+
 class InputNeuronCluster(NeuronCluster):
     '''An artificial neuron with a specified firing frequency
     in KHz (1/ms), to be activated over the given time
     intervals specified as 2-tuples with ms values.
+
+    With poisson the spikes are drawn from a Poisson process, seeded
+    with seed, instead of being regularly spaced. Setting rate to a
+    function of time (vectorized, same units as freq) modulates the
+    Poisson rate.
     '''
-    def __init__(self, name: str, size: int, freq: float, *intervals):
+    def __init__(self, name: str, size: int, freq: float, *intervals,
+                 poisson: bool = False, seed: int = None):
         self.name = name
         self.size = size
         self.freq = freq
+        self.poisson = poisson
+        self.seed = seed
+        self.rate = None
 
         self.intervals = list(intervals)
         self.outputs = []
+        self.receptor_outputs = []
 
         self.sim_start = None
         self.sim_dt = None
 
-        self.spike_index_gen = None
+        self.spike_indices = None
         self.next_spike_index = None
+        self._spike_ptr = 0
 
         self.firing = None
         self.firing_time_indices = []
+        self.firing_times = []
+
+        self.event_synapses = False
+        self._synapse_event = False
+
+    def compute_spike_indices(self, sim_start: float, dt: float):
+        '''The sorted indices of all steps this cluster fires in.'''
+        if not self.poisson:
+            return regular_spike_indices(sim_start, dt, self.freq,
+                                         self.intervals)
+        return poisson_spike_indices(sim_start, dt, self.freq,
+                                     self.intervals,
+                                     np.random.default_rng(self.seed),
+                                     self.rate)
 
     def _validate_activation_intervals(self):
         '''Sort and ensure no overlapping.'''
@@ -111,37 +248,46 @@ class InputNeuronCluster(NeuronCluster):
             assert interval1[1] < interval2[0], \
                 f'Intervals {interval1} and {interval2} overlap.'
 
-    def set_sim_params(self, sim_start: float, sim_dt: float):
-        self.sim_start = sim_start
-        self.sim_dt = sim_dt
-
     def reset(self):
         assert self.sim_start is not None
         assert self.sim_dt is not None
         self.firing = False
         self.firing_time_indices = []
-        self.spike_index_gen = artificial_spike_indices(self.sim_start,
-                                                        self.sim_dt,
-                                                        self.freq,
-                                                        self.intervals)
-        self.next_spike_index = next(self.spike_index_gen)
+        self.firing_times = []
+        self.spike_indices = self.compute_spike_indices(self.sim_start,
+                                                        self.sim_dt)
+        self._spike_ptr = 0
+        self._next_spike()
         for syn in self.outputs:
             syn.reset()
 
     def compute_update(self, time_index: int, dt: float):
         # update each synapse
-        for syn in self.outputs:
-            syn.compute_update(dt, self.firing)
+        self.compute_synapses(time_index, dt)
         if time_index == self.next_spike_index:
             self.firing = True
-            self.firing_time_indices.append(time_index)
-            self.next_spike_index = next(self.spike_index_gen)
+            self.record_spike(time_index)
+            for receptor, weight in self.receptor_outputs:
+                receptor.receive(weight)
+            self._next_spike()
         else:
             self.firing = False
 
+    def seek(self, time_index: int):
+        '''Continue with the first spike at or after time_index.'''
+        self._spike_ptr = int(np.searchsorted(self.spike_indices,
+                                              time_index))
+        self._next_spike()
+
+    def _next_spike(self):
+        if self._spike_ptr < len(self.spike_indices):
+            self.next_spike_index = int(self.spike_indices[self._spike_ptr])
+            self._spike_ptr += 1
+        else:
+            self.next_spike_index = None
+
     def store_update(self):
-        for syn in self.outputs:
-            syn.store_update()
+        self.store_synapses()
 
     def __str__(self):
         return f'{self.name} - size: {self.size}, ' + \
@@ -0,0 +1,155 @@
+'''Figures of simulation results.
+
+Rasters are drawn as one LineCollection of spike ticks, after dropping
+the spikes that would land on the same pixel of the same row, and
+heatmaps are drawn with imshow straight from a rate matrix, so the cost
+of a figure depends on its resolution rather than on the length of the
+run. render_figures draws all figures of a results file at once, each in
+a worker process of its own. The figures are built with the object
+oriented API and the Agg canvas, without pyplot, so the workers need no
+display.
+
+Example
+    render_figures('sim_data/sim2.spikes', 'images', 'sim2_',
+                   cue_labels={0: 'cue on', 1: 'cue off'})
+'''
+import os.path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .results import SimulationResults
+
+DPI = 100
+
+
+def decimate_spikes(times, rows, t0: float, t1: float, width: int):
+    '''The (times, rows) of the spikes with at most one spike per row in
+    each of width bins between t0 and t1, at the center of its bin.'''
+    times = np.asarray(times, dtype=float)
+    rows = np.asarray(rows, dtype=int)
+    bins = np.clip(((times - t0)/(t1 - t0)*width).astype(int), 0, width - 1)
+    keys = np.unique(rows*width + bins)
+    return t0 + (keys % width + .5)*(t1 - t0)/width, keys//width
+
+
+def raster(ax, results, names=None, width: int = None, color='k'):
+    '''Draw the spikes of the clusters names (by default all) of a
+    SimulationResults or spike dict with time grid results.ts, one row
+    per cluster. width is the number of pixel columns of the axes, by
+    default measured from the figure.'''
+    if names is None:
+        names = list(results.keys())
+    ts = results.ts
+    t0, t1 = ts[0], ts[-1]
+    indices = [np.asarray(results[name], dtype=int) for name in names]
+    times = ts[np.concatenate(indices + [np.zeros(0, dtype=int)])]
+    rows = np.repeat(np.arange(len(names)), [len(idx) for idx in indices])
+    if width is None:
+        width = max(int(ax.get_window_extent().width), 1)
+    times, rows = decimate_spikes(times, rows, t0, t1, width)
+
+    from matplotlib.collections import LineCollection
+    ax.hlines(np.arange(len(names)), t0, t1, colors='k', linewidth=0.1)
+    segments = np.empty((len(times), 2, 2))
+    segments[:, :, 0] = times[:, None]
+    segments[:, 0, 1] = rows - .4
+    segments[:, 1, 1] = rows + .4
+    ax.add_collection(LineCollection(segments, colors=color,
+                                     linewidths=1))
+    ax.set_xlim(t0, t1)
+    ax.set_ylim(-1, len(names))
+    ax.set_yticks(np.arange(len(names)))
+    ax.set_yticklabels(names, fontsize='xx-small')
+
+
+def heatmap(ax, matrix, zs, labels, cmap='Blues'):
+    '''Draw the (rows, len(zs)) matrix, e.g. rate_matrix or region rates,
+    with one band per row. Returns the image, for a colorbar.'''
+    zs = np.asarray(zs)
+    dz = zs[1] - zs[0]
+    image = ax.imshow(matrix, aspect='auto', origin='lower', cmap=cmap,
+                      interpolation='nearest',
+                      extent=(zs[0] - dz/2, zs[-1] + dz/2, 0, len(matrix)))
+    ax.hlines(np.arange(len(matrix) + 1), zs[0] - dz/2, zs[-1] + dz/2,
+              colors='k')
+    ax.set_yticks(np.arange(len(matrix)) + .5)
+    ax.set_yticklabels(labels)
+    return image
+
+
+def _time_ticks(ax, t0: float, t1: float, cue_labels: dict):
+    '''Ticks every second, labeled with the cues, and dotted lines at the
+    cues.'''
+    locs = np.arange(np.ceil(t0), np.round(t1) + 1)
+    labels = [f'{loc:g}' + (f'\n{cue_labels[loc]}' if loc in cue_labels
+                            else '')
+              for loc in locs]
+    ax.set_xticks(locs)
+    ax.set_xticklabels(labels)
+    for loc in cue_labels:
+        ax.axvline(loc, color='k', linestyle=':')
+    ax.set_xlabel('time (s)')
+
+
+def _figure(figsize):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize, dpi=DPI)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def spikes_figure(results, img_path: str, cue_labels: dict = None):
+    fig = _figure((20, 10))
+    ax = fig.add_subplot()
+    raster(ax, results)
+    ax.set_title('Spikes')
+    fig.savefig(img_path)
+
+
+def eb_activity_figure(results, img_path: str, cue_labels: dict = None,
+                       dz: float = 0.01, font_size: float = 22):
+    '''The EB region rates on a grid of spacing dz, see analysis.py.'''
+    import matplotlib
+    from .analysis import AnalysisCache
+    from .fruit_fly_network import EB_INNERVATION
+    ts = results.ts
+    zs, EB_rates = AnalysisCache().region_rates(results, dz=dz)
+
+    with matplotlib.rc_context({'font.size': font_size}):
+        fig = _figure((20, 10))
+        ax = fig.add_subplot()
+        image = heatmap(ax, EB_rates, zs, EB_INNERVATION.columns)
+        _time_ticks(ax, ts[0], ts[-1], cue_labels or {})
+        ax.set_title('EB Activity')
+        fig.colorbar(image, ax=ax, label='Hz')
+        fig.savefig(img_path)
+
+
+FIGURES = {
+    'spikes': spikes_figure,
+    'EB_activity': eb_activity_figure
+}
+
+
+def _render(figure: str, results_path: str, img_path: str,
+            cue_labels: dict):
+    FIGURES[figure](SimulationResults(results_path), img_path, cue_labels)
+    return img_path
+
+
+def render_figures(results_path: str, image_dir: str, prefix: str = '',
+                   figures=None, cue_labels: dict = None,
+                   workers: int = None):
+    '''Draw the figures, by name from FIGURES and by default all of them,
+    of a results file to image_dir/<prefix><name>.png in parallel.
+    Returns the image paths.'''
+    if figures is None:
+        figures = list(FIGURES.keys())
+    with ProcessPoolExecutor(workers) as pool:
+        jobs = [pool.submit(_render, figure, results_path,
+                            os.path.join(image_dir, f'{prefix}{figure}.png'),
+                            cue_labels)
+                for figure in figures]
+        return [job.result() for job in jobs]
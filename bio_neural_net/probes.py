@@ -0,0 +1,95 @@
+'''Probes recording state variables into preallocated buffers.'''
+import numpy as np
+
+
+class Probe:
+    '''Samples read() every stride time steps.
+
+    Without a capacity the buffer holds every sample of the run. With a
+    capacity it is a ring buffer keeping only the most recent samples.
+    Engines create probes with their probe() method and sample them
+    after every step.
+    '''
+    def __init__(self, read, quantity: str, targets: list,
+                 stride: int = 1, capacity: int = None):
+        self.read = read
+        self.quantity = quantity
+        self.targets = list(targets)
+        self.stride = stride
+        self.capacity = capacity
+        self.ring = capacity is not None
+
+        self.start_time = None
+        self.dt = None
+        self._values = None
+        self._time_indices = None
+        self.count = 0
+        self.next_index = 0
+
+    def reset(self, start_time: float, dt: float, num_steps: int):
+        self.start_time = start_time
+        self.dt = dt
+        if not self.ring:
+            self.capacity = num_steps//self.stride + 1
+        self._values = None
+        self._time_indices = np.empty(self.capacity, dtype=int)
+        self.count = 0
+        self.next_index = 0
+
+    def sample(self, time_index: int):
+        if time_index < self.next_index:
+            return
+        value = self.read()
+        if self._values is None:
+            self._values = np.empty((self.capacity, *np.shape(value)))
+        if self.ring:
+            slot = self.count % self.capacity
+        else:
+            assert self.count < self.capacity, \
+                'The probe buffer is full, give it a capacity to keep ' + \
+                'only the latest samples.'
+            slot = self.count
+        self._values[slot] = value
+        self._time_indices[slot] = time_index
+        self.count += 1
+        self.next_index = (time_index//self.stride + 1)*self.stride
+
+    def _order(self):
+        size = min(self.count, self.capacity)
+        if self.ring and self.count > self.capacity:
+            return np.roll(np.arange(size), -(self.count % self.capacity))
+        return np.arange(size)
+
+    def since(self, count: int):
+        '''The (time indices, values) of the samples from the count-th
+        on that are still in the buffer.'''
+        first = max(count, self.count - self.capacity, 0)
+        slots = np.arange(first, self.count)
+        if self.ring:
+            slots %= self.capacity
+        if self._values is None:
+            return self._time_indices[slots], np.empty((0, len(self.targets)))
+        return self._time_indices[slots], self._values[slots]
+
+    @property
+    def time_indices(self):
+        return self._time_indices[self._order()]
+
+    @property
+    def times(self):
+        return self.start_time + self.time_indices*self.dt
+
+    @property
+    def values(self):
+        '''The samples in time order, one row per sample and the targets
+        along the last axis (after the replica axis for ArrayNetworks).'''
+        if self._values is None:
+            return np.empty((0, len(self.targets)))
+        return self._values[self._order()]
+
+    def __str__(self):
+        return f'Probe: {self.quantity} of {len(self.targets)} targets ' + \
+               f'every {self.stride} steps'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
@@ -0,0 +1,74 @@
+'''Firing rate estimates from recorded spikes.
+
+The rate of a cluster is its spike train smoothed with the causal kernel
+    kern(t) = 1/scale*heaviside(t, .5)*exp(-t/scale)
+evaluated on a uniform grid. Rather than summing one kernel per spike,
+the spikes are binned between grid points, weighted by their decay to
+the end of their bin, and the bins are passed through the first order
+recursive filter
+    s[k] = exp(-dz/scale)*s[k-1] + binned[k]
+for all clusters at once. The result is exact, not an approximation of
+the kernel sum.
+
+Example
+    results = SimulationResults('sim_data/sim2.spikes')
+    zs = np.linspace(results.ts[0], results.ts[-1], 1001)
+    rates = rate_matrix(results, results.ts, zs)
+    EB_rates = region_matrix(EB_INNERVATION, results.keys()) @ rates
+'''
+import numpy as np
+import scipy.sparse as sp
+from scipy.signal import lfilter
+
+
+def rate_matrix(spike_dict, ts, zs, scale: float = 0.05, names=None):
+    '''The (clusters, len(zs)) matrix of the rates of the clusters names
+    (by default all of spike_dict) at the uniformly spaced times zs.
+    spike_dict maps each name to firing time indices into ts, as stored
+    by the sim scripts.'''
+    if names is None:
+        names = list(spike_dict.keys())
+    zs = np.asarray(zs, dtype=float)
+    ts = np.asarray(ts, dtype=float)
+    dz = zs[1] - zs[0]
+    assert np.allclose(np.diff(zs), dz), 'zs must be uniformly spaced.'
+
+    indices = [np.asarray(spike_dict[name], dtype=int) for name in names]
+    rows = np.repeat(np.arange(len(names)),
+                     [len(idx) for idx in indices])
+    times = ts[np.concatenate(indices + [np.zeros(0, dtype=int)])]
+
+    # grid point k collects the spikes in (zs[k-1], zs[k]], weighted by
+    # their decay to zs[k]; spikes after the grid are dropped
+    bins = np.searchsorted(zs, times, side='left')
+    keep = bins < len(zs)
+    rows, times, bins = rows[keep], times[keep], bins[keep]
+    weights = np.exp(-(zs[bins] - times)/scale)
+    # spikes landing exactly on a grid point count half there
+    on_grid = zs[bins] == times
+    binned = np.zeros((len(names), len(zs)))
+    np.add.at(binned, (rows, bins), weights - .5*on_grid)
+    # ... and fully in the following ones
+    carry = np.zeros_like(binned)
+    np.add.at(carry, (rows[on_grid], bins[on_grid]), .5)
+    binned[:, 1:] += carry[:, :-1]*np.exp(-dz/scale)
+
+    return lfilter([1.0], [1.0, -np.exp(-dz/scale)], binned, axis=1)/scale
+
+
+def region_matrix(innervation, names, value: float = 1.0):
+    '''The sparse (regions, clusters) matrix summing the rates of the
+    clusters names over the regions they innervate, so that
+    region_matrix(...) @ rate_matrix(...) gives the region rates.
+    innervation is a table such as EB_INNERVATION, indexed by cluster
+    with one column per region, and only entries equal to value count.'''
+    index = {name: i for i, name in enumerate(names)}
+    regions = list(innervation.columns)
+    rows, cols = [], []
+    for row, region in enumerate(regions):
+        column = innervation[region]
+        for name in column.index[column == value]:
+            rows.append(row)
+            cols.append(index[name])
+    return sp.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                         shape=(len(regions), len(index)))
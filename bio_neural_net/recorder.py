@@ -0,0 +1,123 @@
+'''Recording of spikes into flat arrays.'''
+import numpy as np
+
+
+class SpikeRecorder:
+    '''Collects (id, time index) pairs in preallocated int32 chunks,
+    and optionally the spike times, without creating a Python object per
+    spike. Ids are cluster indices, offset by replica*len(names) for
+    engines with several replicas.
+
+    csr() rearranges the spikes per id into the offsets and time indices
+    of a compressed sparse row layout.
+    '''
+    def __init__(self, names, replicas: int = 1,
+                 record_times: bool = False,
+                 chunk_size: int = 1 << 16):
+        self.names = list(names)
+        self.replicas = replicas
+        self.num_ids = replicas*len(self.names)
+        self.record_times = record_times
+        self.chunk_size = chunk_size
+        self.clear()
+
+    def clear(self):
+        self._chunks = []
+        self._time_chunks = []
+        self._fill = self.chunk_size  # spikes in the last chunk
+        self._count = 0
+        self._csr = None
+
+    def __len__(self):
+        return self._count
+
+    def _new_chunk(self):
+        self._chunks.append(np.empty((self.chunk_size, 2), dtype=np.int32))
+        if self.record_times:
+            self._time_chunks.append(np.empty(self.chunk_size))
+        self._fill = 0
+
+    def record(self, ids, time_index: int, times=None):
+        '''Record spikes of the clusters ids at time_index.'''
+        self._csr = None
+        self._count += len(ids)
+        start = 0
+        while start < len(ids):
+            if self._fill == self.chunk_size:
+                self._new_chunk()
+            count = min(len(ids) - start, self.chunk_size - self._fill)
+            chunk = self._chunks[-1]
+            chunk[self._fill:self._fill+count, 0] = ids[start:start+count]
+            chunk[self._fill:self._fill+count, 1] = time_index
+            if self.record_times:
+                self._time_chunks[-1][self._fill:self._fill+count] = \
+                    times[start:start+count]
+            self._fill += count
+            start += count
+
+    def record_table(self, table, times=None):
+        '''Record the (id, time index) rows of table, as returned by
+        table().'''
+        self._csr = None
+        self._count += len(table)
+        start = 0
+        while start < len(table):
+            if self._fill == self.chunk_size:
+                self._new_chunk()
+            count = min(len(table) - start, self.chunk_size - self._fill)
+            self._chunks[-1][self._fill:self._fill+count] = \
+                table[start:start+count]
+            if self.record_times:
+                self._time_chunks[-1][self._fill:self._fill+count] = \
+                    times[start:start+count]
+            self._fill += count
+            start += count
+
+    def table(self, start: int = 0):
+        '''All (id, time index) rows in the order they were recorded,
+        or only those from the start-th spike on.'''
+        if start >= self._count:
+            return np.empty((0, 2), dtype=np.int32)
+        first = start // self.chunk_size
+        table = np.concatenate(self._chunks[first:-1] +
+                               [self._chunks[-1][:self._fill]])
+        return table[start - first*self.chunk_size:]
+
+    def times(self):
+        '''The spike times in the order they were recorded.'''
+        assert self.record_times, 'Spike times were not recorded.'
+        if not self._chunks:
+            return np.empty(0)
+        return np.concatenate(self._time_chunks[:-1] +
+                              [self._time_chunks[-1][:self._fill]])
+
+    def csr(self):
+        '''The (offsets, time indices) of the spikes of every id, so that
+        the spikes of id i are time_indices[offsets[i]:offsets[i+1]].'''
+        if self._csr is None:
+            table = self.table()
+            order = np.argsort(table[:, 0], kind='stable')
+            offsets = np.zeros(self.num_ids + 1, dtype=np.int64)
+            np.cumsum(np.bincount(table[:, 0], minlength=self.num_ids),
+                      out=offsets[1:])
+            self._csr = (offsets, table[order, 1], order)
+        return self._csr[:2]
+
+    def firing_time_indices(self, name: str, replica: int = 0):
+        offsets, time_indices = self.csr()
+        i = replica*len(self.names) + self.names.index(name)
+        return time_indices[offsets[i]:offsets[i+1]]
+
+    def firing_times(self, name: str, replica: int = 0):
+        offsets, _ = self.csr()
+        order = self._csr[2]
+        i = replica*len(self.names) + self.names.index(name)
+        return self.times()[order[offsets[i]:offsets[i+1]]]
+
+    def spike_dict(self, replica: int = 0) -> dict:
+        '''The firing time indices of every cluster, in the layout the
+        sim scripts pickle.'''
+        offsets, time_indices = self.csr()
+        base = replica*len(self.names)
+        return {name: time_indices[offsets[base+i]:offsets[base+i+1]]
+                for i, name in enumerate(self.names)}
@@ -0,0 +1,193 @@
+'''A columnar, memory mappable file format for simulation results.
+
+Layout, with every section aligned to 8 bytes:
+    magic      8 bytes, b'BNNSPK01'
+    size       uint64, the size of the header in bytes
+    header     UTF-8 JSON: names, start_time, dt, num_steps, spec and the
+               byte offsets of the sections below
+    offsets    int64 (len(names) + 1,) CSR offsets, the spikes of cluster
+               i are entries offsets[i]:offsets[i+1] of deltas
+    deltas     int32 delta encoded time indices, the first spike of every
+               cluster is stored as its time index and every later one as
+               the difference to the previous spike
+
+Reading memory maps the sections, so only the clusters asked for are
+decoded. The time grid is reconstructed from start_time, dt and
+num_steps rather than stored.
+
+Run as a module to convert the pickles written by earlier sim scripts
+    python -m bio_neural_net.results sim_data/sim2.pickle
+'''
+import json
+import os.path
+import pickle
+import sys
+
+import numpy as np
+
+MAGIC = b'BNNSPK01'
+
+
+def _align(position: int) -> int:
+    return (position + 7)//8*8
+
+
+def _jsonable(obj):
+    '''Parameter dictionaries use tuples such as ('EIP', 'PEI') as keys,
+    which JSON does not allow.'''
+    if isinstance(obj, dict):
+        return {key if isinstance(key, str) else repr(key): _jsonable(value)
+                for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_jsonable(value) for value in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def save_results(path: str,
+                 spike_dict: dict,
+                 start_time: float,
+                 dt: float,
+                 num_steps: int,
+                 spec: dict = None):
+    '''Write the firing time indices of every cluster, as stored by the
+    spike recorders and the sim scripts, to path. spec is any JSON
+    serializable description of the network and experiment.'''
+    names = list(spike_dict.keys())
+    indices = [np.asarray(spike_dict[name], dtype=np.int64)
+               for name in names]
+    offsets = np.cumsum([0] + [len(idx) for idx in indices], dtype=np.int64)
+    deltas = np.concatenate(
+            [np.diff(idx, prepend=0) for idx in indices] +
+            [np.zeros(0, dtype=np.int64)]).astype(np.int32)
+
+    header = {
+        'names': names,
+        'start_time': start_time,
+        'dt': dt,
+        'num_steps': num_steps,
+        'spec': _jsonable(spec),
+        'count': int(offsets[-1]),
+        'offsets_start': None,
+        'deltas_start': None
+    }
+    # the section offsets depend on the size of the header itself
+    while True:
+        encoded = json.dumps(header).encode()
+        offsets_start = _align(len(MAGIC) + 8 + len(encoded))
+        deltas_start = _align(offsets_start + offsets.nbytes)
+        if header['offsets_start'] == offsets_start and \
+                header['deltas_start'] == deltas_start:
+            break
+        header['offsets_start'] = offsets_start
+        header['deltas_start'] = deltas_start
+    encoded += b' '*(offsets_start - len(MAGIC) - 8 - len(encoded))
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(encoded)).tobytes())
+        f.write(encoded)
+        f.write(offsets.tobytes())
+        f.write(b'\0'*(header['deltas_start'] - f.tell()))
+        f.write(deltas.tobytes())
+
+
+class SimulationResults:
+    '''Lazy, read only access to a results file.'''
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            assert f.read(len(MAGIC)) == MAGIC, \
+                f'{path} is not a simulation results file.'
+            size = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            self.header = json.loads(f.read(size))
+        self.names = self.header['names']
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.start_time = self.header['start_time']
+        self.dt = self.header['dt']
+        self.num_steps = self.header['num_steps']
+        self.spec = self.header['spec']
+
+        self.offsets = np.memmap(path, dtype=np.int64, mode='r',
+                                 offset=self.header['offsets_start'],
+                                 shape=(len(self.names) + 1,))
+        count = self.header['count']
+        if count > 0:
+            self.deltas = np.memmap(path, dtype=np.int32, mode='r',
+                                    offset=self.header['deltas_start'],
+                                    shape=(count,))
+        else:
+            self.deltas = np.zeros(0, dtype=np.int32)
+
+    @property
+    def ts(self):
+        return self.start_time + np.arange(self.num_steps)*self.dt
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def keys(self):
+        return self.names
+
+    def items(self):
+        return ((name, self[name]) for name in self.names)
+
+    def __getitem__(self, name: str):
+        return self.firing_time_indices(name)
+
+    def firing_time_indices(self, name: str,
+                            start: int = None, stop: int = None):
+        '''The time indices of the spikes of a cluster, optionally only
+        those in the window start <= index < stop.'''
+        i = self.index[name]
+        indices = np.cumsum(self.deltas[self.offsets[i]:self.offsets[i+1]],
+                            dtype=np.int64)
+        if start is not None:
+            indices = indices[np.searchsorted(indices, start):]
+        if stop is not None:
+            indices = indices[:np.searchsorted(indices, stop)]
+        return indices
+
+    def firing_times(self, name: str,
+                     start_time: float = None, end_time: float = None):
+        '''The spike times of a cluster, optionally only those in the
+        window start_time <= t < end_time.'''
+        start = None if start_time is None else \
+            int(np.ceil((start_time - self.start_time)/self.dt))
+        stop = None if end_time is None else \
+            int(np.ceil((end_time - self.start_time)/self.dt))
+        return self.start_time + \
+            self.firing_time_indices(name, start, stop)*self.dt
+
+    def spike_dict(self, names=None) -> dict:
+        if names is None:
+            names = self.names
+        return {name: self[name] for name in names}
+
+    def __str__(self):
+        return f'SimulationResults: {len(self.names)} neurons, ' + \
+               f'{self.header["count"]} spikes, ' + \
+               f'{self.num_steps} steps of {self.dt}s'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
+
+
+def convert_pickle(pickle_path: str, path: str = None):
+    '''Convert a (ts, spike_dict) pickle written by the sim scripts.'''
+    if path is None:
+        path = os.path.splitext(pickle_path)[0] + '.spikes'
+    with open(pickle_path, 'rb') as f:
+        ts, spike_dict = pickle.load(f)
+    save_results(path, spike_dict, float(ts[0]), float(ts[1] - ts[0]),
+                 len(ts))
+    return path
+
+
+if __name__ == '__main__':
+    for pickle_path in sys.argv[1:]:
+        print(f'Converted {convert_pickle(pickle_path)}')
@@ -0,0 +1,163 @@
+'''Ring attractor networks of any size with the motif of Su et al. 2017.
+
+The innervation tables are generated for num_wedges EB wedges, an even
+number, and the num_wedges + 2 PB glomeruli that motif implies, instead
+of being read from the csv files. With num_wedges 16 they equal the
+tables of fruit_fly_network and get_ring_network builds the same
+network as get_fruit_fly_network.
+
+The EB regions are R<n> ... R1, L1 ... L<n> and the PB glomeruli
+R<n> ... R0, L0 ... L<n>, for n = num_wedges/2, in ring order.
+    EIP i  dendrites in three neighbouring wedges, two apart from one
+           cluster to the next, only one wedge for the first and last
+           EIP, and an axon in glomerulus i
+    PEI k  axons in two neighbouring wedges and dendrites in glomerulus
+           k + 1
+    PEN k  as PEI k, with dendrites in glomerulus k in the right PB and
+           k + 2 in the left PB
+Each ring has its own REIP, RPEI and RPEN clusters and inputs, and with
+several rings every name is prefixed with ring<r>.
+
+Example
+    net = get_ring_network(num_wedges=1024, rings=4)
+'''
+import numpy as np
+import scipy.sparse as sp
+
+from .fruit_fly_network import (
+    ACETYLCHOLINE_PARAMS,
+    CONDUCTANCE_DICT,
+    DEFAULT_NEURON_PARAMS,
+    EB_REGIONS,
+    GABAA_PARAMS,
+    INPUT_NEURONS,
+    INPUT_SYNAPSE_CONDUCTANCE,
+    NMDA_PARAMS,
+    REIP_PARAMS,
+    add_ring
+)
+from .network import Network
+
+
+def _index(num_wedges: int):
+    return [f'EIP{i}' for i in range(num_wedges + 2)] + \
+           [f'PEI{k}' for k in range(num_wedges)] + \
+           [f'PEN{k}' for k in range(num_wedges)]
+
+
+def eb_regions(num_wedges: int):
+    n = num_wedges//2
+    return [f'EB-R{i}' for i in range(n, 0, -1)] + \
+           [f'EB-L{i}' for i in range(1, n + 1)]
+
+
+def pb_regions(num_wedges: int):
+    n = num_wedges//2
+    return [f'PB-R{i}' for i in range(n, -1, -1)] + \
+           [f'PB-L{i}' for i in range(n + 1)]
+
+
+def _check(num_wedges: int):
+    assert num_wedges >= 4 and num_wedges % 2 == 0, \
+        'The ring needs an even number of at least 4 wedges.'
+
+
+def eb_innervation(num_wedges: int):
+    '''The (index, columns, values) EB innervation table, with values a
+    sparse matrix.'''
+    _check(num_wedges)
+    n = num_wedges//2
+    EIPs = np.arange(num_wedges + 2)
+    # the first wedge of each EIP, in the right and then the left half
+    first = np.where(EIPs <= n, 2*EIPs - 2, 2*(EIPs - n - 1) - 1)
+    EIP_rows = np.repeat(EIPs, 3)
+    EIP_cols = (first[:, None] + np.arange(3)).ravel()
+    # the first and last EIP do not wrap around the ring
+    keep = ((EIP_rows != 0) | (EIP_cols >= 0)) & \
+        ((EIP_rows != num_wedges + 1) | (EIP_cols < num_wedges))
+    EIP_rows, EIP_cols = EIP_rows[keep], EIP_cols[keep] % num_wedges
+
+    ks = np.arange(num_wedges)
+    first = np.where(ks < n, 2*ks + 1, 2*(ks - n) - 1)
+    P_rows = np.repeat(ks, 2)
+    P_cols = (first[:, None] + np.arange(2)).ravel() % num_wedges
+
+    rows = np.concatenate([EIP_rows,
+                           num_wedges + 2 + P_rows,  # PEI
+                           2*num_wedges + 2 + P_rows])  # PEN
+    cols = np.concatenate([EIP_cols, P_cols, P_cols])
+    data = np.concatenate([np.ones(len(EIP_rows)),
+                           np.full(2*len(P_rows), 2.0)])
+    values = sp.csr_matrix((data, (rows, cols)),
+                           shape=(3*num_wedges + 2, num_wedges))
+    return _index(num_wedges), eb_regions(num_wedges), values
+
+
+def pb_innervation(num_wedges: int):
+    '''The (index, columns, values) PB innervation table, with values a
+    sparse matrix.'''
+    _check(num_wedges)
+    n = num_wedges//2
+    EIPs = np.arange(num_wedges + 2)
+    ks = np.arange(num_wedges)
+    rows = np.concatenate([EIPs,
+                           num_wedges + 2 + ks,  # PEI
+                           2*num_wedges + 2 + ks])  # PEN
+    cols = np.concatenate([EIPs, ks + 1, np.where(ks < n, ks, ks + 2)])
+    data = np.concatenate([np.full(len(EIPs), 2.0),
+                           np.ones(2*num_wedges)])
+    values = sp.csr_matrix((data, (rows, cols)),
+                           shape=(3*num_wedges + 2, num_wedges + 2))
+    return _index(num_wedges), pb_regions(num_wedges), values
+
+
+def _region_inputs(table: dict, regions):
+    '''table, such as INPUT_NEURONS, with the EB region inputs replaced by
+    those of regions, using the entry of the first EB region.'''
+    region_value = table[EB_REGIONS[0] + '_input']
+    return {**{region + '_input': region_value for region in regions},
+            **{key: value for key, value in table.items()
+               if not key.startswith('EB-')}}
+
+
+def get_ring_network(
+            num_wedges: int = 16,
+            rings: int = 1,
+            EIP_params=DEFAULT_NEURON_PARAMS,
+            PEI_params=DEFAULT_NEURON_PARAMS,
+            PEN_params=DEFAULT_NEURON_PARAMS,
+            REIP_params=REIP_PARAMS,
+            RPEI_params=DEFAULT_NEURON_PARAMS,
+            RPEN_params=DEFAULT_NEURON_PARAMS,
+            GABAA_params=GABAA_PARAMS,
+            acetylcholine_params=ACETYLCHOLINE_PARAMS,
+            NMDA_params=NMDA_PARAMS,
+            conductance_dict=CONDUCTANCE_DICT,
+            input_neurons=None,
+            input_synapse_conductance=None
+        ) -> Network:
+    '''A network of rings independent rings of num_wedges wedges, see
+    the module docstring. The parameters are those of
+    get_fruit_fly_network, by default with the EB inputs of its first EB
+    region for every region.'''
+    EB_table = eb_innervation(num_wedges)
+    PB_table = pb_innervation(num_wedges)
+    regions = EB_table[1]
+    if input_neurons is None:
+        input_neurons = _region_inputs(INPUT_NEURONS, regions)
+    if input_synapse_conductance is None:
+        input_synapse_conductance = _region_inputs(
+                INPUT_SYNAPSE_CONDUCTANCE, regions)
+
+    net = Network()
+    connections = []
+    for ring in range(rings):
+        add_ring(net, connections, EB_table, PB_table,
+                 EIP_params, PEI_params, PEN_params,
+                 REIP_params, RPEI_params, RPEN_params,
+                 GABAA_params, acetylcholine_params, NMDA_params,
+                 conductance_dict, input_neurons,
+                 input_synapse_conductance,
+                 prefix=f'ring{ring}.' if rings > 1 else '')
+    net.add_synapses(connections)
+    return net
@@ -0,0 +1,255 @@
+'''A closed loop simulation server on a local socket.
+
+The server simulates the fruit fly network in blocks of `every` steps,
+paced to the wall clock, while controllers connected over TCP switch
+input clusters such as rot_CW, rot_CCW or EB-L1_input on and off. After
+every block all clients receive a frame with the EB bump decoded by a
+BumpDecoder. Messages in both directions are JSON objects, one per line.
+
+Commands
+    {"command": "on", "input": "rot_CW"}   start firing from now on
+    {"command": "off", "input": "rot_CW"}  stop firing
+    {"command": "status"}                  reply with a status frame
+    {"command": "stop"}                    end the simulation
+
+Frames
+    {"time": 1.25, "angle": [...], "amplitude": [...], "rates": [[...]],
+     "rtf": 3.1, "lag": 0.0}
+with one entry per replica. rtf is the real time factor, simulated time
+over the wall time spent simulating, so the network keeps up with the
+wall clock while it is above 1. lag is how far the simulation trails the
+wall clock, in seconds. Without pacing the simulation runs as fast as it
+can. Malformed commands are answered with {"error": "..."}.
+
+The blocks are simulated in a worker thread, so the event loop keeps
+serving clients meanwhile. Switches are queued and applied between
+blocks, recomputing the input spikes of the switched cluster only.
+
+Run as a module to serve the fruit fly network
+    python -m bio_neural_net.server --port 5314 --engine array --dt 1e-4
+'''
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+
+from .decoder import BumpDecoder
+from .neuron import InputNeuronCluster
+
+FRAME_BUFFER_LIMIT = 1 << 16  # bytes, frames to slower clients are dropped
+
+
+class SimulationServer:
+    '''Serves engine, a Network or ArrayNetwork with its time parameters
+    set, on host:port. With speed the simulation is paced to speed
+    times the wall clock, with speed None it runs freely. With
+    wait_for_client the simulation starts once the first client
+    connects.'''
+    def __init__(self, engine, host: str = '127.0.0.1', port: int = 5314,
+                 every: int = 100, speed: float = 1.0,
+                 wait_for_client: bool = True):
+        assert hasattr(engine, 'reschedule_inputs'), \
+            f'{engine} cannot change its inputs while running.'
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.every = every
+        self.speed = speed
+        self.wait_for_client = wait_for_client
+        self.decoder = BumpDecoder(capacity=1, discard_spikes=True)
+
+        self.clients = set()
+        self.compute_time = 0.0
+        self.lag = 0.0
+        self._connected = None
+        self._stopped = False
+        # (name, on) switches waiting for the end of the block
+        self._switches = deque()
+        self._frame = None
+
+    @property
+    def time(self):
+        return self.engine.start_time + self.engine.time_index*self.engine.dt
+
+    @property
+    def end_time(self):
+        return self.engine.start_time + self.engine.num_steps*self.engine.dt
+
+    @property
+    def rtf(self):
+        elapsed = self.time - self.engine.start_time
+        return elapsed/self.compute_time if self.compute_time > 0 else 0.0
+
+    def _inputs(self, name: str):
+        '''The input cluster name of every replica.'''
+        nets = getattr(self.engine, 'nets', [self.engine])
+        if not isinstance(name, str) or not all(
+                isinstance(net.neurons.get(name), InputNeuronCluster)
+                for net in nets):
+            raise ValueError(f'{name!r} is not an input cluster.')
+        return [net.neurons[name] for net in nets]
+
+    def switch(self, name: str, on: bool):
+        '''Start or stop the input cluster name at the current time. Only
+        call this between blocks, see handle.'''
+        now = self.time
+        for neuron in self._inputs(name):
+            intervals = neuron.intervals
+            active = bool(intervals) and intervals[-1][1] > now
+            if on and not active:
+                if intervals and intervals[-1][1] >= now:
+                    # continue the interval that just ended
+                    intervals[-1] = (intervals[-1][0], self.end_time)
+                else:
+                    intervals.append((now, self.end_time))
+            elif not on and active:
+                if intervals[-1][0] >= now:
+                    intervals.pop()
+                else:
+                    intervals[-1] = (intervals[-1][0], now)
+        self.engine.reschedule_inputs([name])
+
+    def frame(self) -> dict:
+        decoder = self.decoder
+        if decoder.rates is None:
+            angle = amplitude = rates = []
+        else:
+            angle = decoder.angle[-1].tolist()
+            amplitude = decoder.amplitude[-1].tolist()
+            rates = decoder.rates.tolist()
+        return {'time': self.time, 'angle': angle, 'amplitude': amplitude,
+                'rates': rates, 'rtf': self.rtf, 'lag': self.lag}
+
+    def _send(self, writer, message: dict):
+        if writer.is_closing() or \
+                writer.transport.get_write_buffer_size() > FRAME_BUFFER_LIMIT:
+            return
+        writer.write(json.dumps(message).encode() + b'\n')
+
+    def handle(self, message) -> dict:
+        '''Apply a decoded command, returning the reply, if any. Switches
+        are only queued, see _advance. Raises a ValueError for malformed
+        commands.'''
+        if not isinstance(message, dict):
+            raise ValueError('Commands are JSON objects.')
+        command = message.get('command')
+        if command in ('on', 'off'):
+            name = message.get('input')
+            self._inputs(name)
+            self._switches.append((name, command == 'on'))
+        elif command == 'status':
+            return self._frame or self.frame()
+        elif command == 'stop':
+            self._stopped = True
+        else:
+            raise ValueError(f'Unknown command {command!r}.')
+
+    async def _client(self, reader, writer):
+        self.clients.add(writer)
+        self._connected.set()
+        try:
+            while line := await reader.readline():
+                try:
+                    reply = self.handle(json.loads(line))
+                except ValueError as error:
+                    reply = {'error': str(error)}
+                if reply is not None:
+                    self._send(writer, reply)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # the client went away
+        except ValueError:
+            pass  # a line above the stream limit, drop the client
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    def _advance(self, n_steps: int):
+        '''Apply the queued switches and simulate a block, in the worker
+        thread.'''
+        tic = time.perf_counter()
+        while self._switches:
+            self.switch(*self._switches.popleft())
+        self.engine.run(n_steps)
+        self.decoder(self.engine)
+        self.compute_time += time.perf_counter() - tic
+
+    async def simulate(self):
+        '''Simulate until the end time or a stop command, sending a frame
+        to every client after each block.'''
+        engine = self.engine
+        if engine.time_index is None:
+            engine.reset()
+        if self.wait_for_client:
+            await self._connected.wait()
+        start_time = self.time
+        wall_start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        while not self._stopped and engine.time_index < engine.num_steps:
+            await loop.run_in_executor(
+                    None, self._advance,
+                    min(self.every, engine.num_steps - engine.time_index))
+
+            self._frame = frame = self.frame()
+            for writer in list(self.clients):
+                self._send(writer, frame)
+
+            delay = 0.0
+            if self.speed is not None:
+                wall = time.perf_counter() - wall_start
+                delay = (self.time - start_time)/self.speed - wall
+                self.lag = max(-delay, 0.0)
+            # let the clients' commands in between blocks
+            await asyncio.sleep(max(delay, 0.0))
+
+    async def serve(self):
+        self._connected = asyncio.Event()
+        server = await asyncio.start_server(self._client,
+                                            self.host, self.port)
+        async with server:
+            await self.simulate()
+            for writer in list(self.clients):
+                writer.close()
+
+    def __str__(self):
+        return f'SimulationServer: {self.host}:{self.port}, ' + \
+               f'{self.time:.3f}s, rtf {self.rtf:.2f}'
+
+    def __repr__(self):
+        return str(self) + f' @ {id(self)}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description='Serve the fruit fly network for closed loop '
+                        'control.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5314)
+    parser.add_argument('--engine', choices=('object', 'array'),
+                        default='array')
+    parser.add_argument('--integrator', default='euler')
+    parser.add_argument('--dt', type=float, default=1e-4)
+    parser.add_argument('--duration', type=float, default=3600.0,
+                        help='simulated seconds')
+    parser.add_argument('--every', type=int, default=100,
+                        help='steps per frame')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='simulated seconds per wall clock second')
+    parser.add_argument('--free', action='store_true',
+                        help='run as fast as possible')
+    args = parser.parse_args(argv)
+
+    from .fruit_fly_network import get_fruit_fly_network
+    net = get_fruit_fly_network()
+    net.set_time_params(0.0, args.dt, round(args.duration/args.dt))
+    net.set_integrator(args.integrator)
+    engine = net.compile() if args.engine == 'array' else net
+    server = SimulationServer(engine, args.host, args.port, args.every,
+                              speed=None if args.free else args.speed)
+    print(f'Serving on {args.host}:{args.port}')
+    asyncio.run(server.serve())
+    print(server)
+
+
+if __name__ == '__main__':
+    main()
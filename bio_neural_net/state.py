@@ -0,0 +1,19 @@
+'''Compact serialization of simulation state, see Network.snapshot and
+ArrayNetwork.snapshot.'''
+import io
+
+import numpy as np
+
+
+def pack_state(kind: str, **arrays) -> bytes:
+    '''Store the state arrays of an engine of type kind as bytes.'''
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, kind=kind, **arrays)
+    return buffer.getvalue()
+
+
+def unpack_state(blob: bytes, kind: str) -> dict:
+    with np.load(io.BytesIO(blob)) as state:
+        state = dict(state)
+    assert state.pop('kind') == kind, f'Not a snapshot of a {kind}.'
+    return state
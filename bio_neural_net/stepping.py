@@ -0,0 +1,28 @@
+'''Block stepping shared by the simulation engines.'''
+
+
+def run_in_blocks(engine, n_steps: int = None, callback=None,
+                  every: int = None):
+    '''Advance engine by n_steps time steps (by default the remaining
+    steps of its num_steps) with engine.advance, returning to Python level
+    user code only every `every` steps to call callback(engine). If the
+    callback returns True the run stops early, so a callback that only
+    reports progress must return None, e.g. not the result of
+    tqdm.update, which is True whenever the bar is redrawn. Returns the
+    number of steps taken.'''
+    if every is not None and every < 1:
+        raise ValueError(f'every must be at least 1, not {every}.')
+    if engine.time_index is None:
+        engine.reset()
+    if n_steps is None:
+        n_steps = engine.num_steps - engine.time_index
+    if every is None:
+        every = n_steps
+    done = 0
+    while done < n_steps:
+        block = min(every, n_steps - done)
+        engine.advance(block)
+        done += block
+        if callback is not None and callback(engine):
+            break
+    return done
@@ -0,0 +1,236 @@
+'''Parameter sweeps over the fruit fly network.
+
+Runs are fanned out over a process pool. Every worker writes its spikes
+straight into memory mapped arrays in the sweep directory instead of
+sending them back through the pool:
+    spikes.npy  (runs, max_spikes, 2) int32 rows of (cluster, time index)
+    counts.npy  (runs,) int64 number of spikes, -1 while a run is pending.
+                A count above max_spikes marks a run whose spikes were
+                cut off at max_spikes, see SweepResult.truncated.
+    aborts.npy  (runs, 2) int64 time index and reason (an index into the
+                reasons of sweep.json) of runs aborted by a monitor,
+                -1 for runs that were not
+    sweep.json  the sweep description
+A run is only marked as finished once its spikes are on disk, so a sweep
+that is killed part way skips the finished runs when restarted.
+
+Example
+    overrides = override_grid({
+        ('conductance_dict', ('EIP', 'PEI')): [5, 8, 11],
+        ('input_neurons', 'rot_CW', 'freq'): [50, 315]})
+    run_sweep('sim_data/sweep1', overrides, cue_dict, 0.0, 10.0, 1e-4)
+'''
+import json
+import os.path
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+
+import numpy as np
+from tqdm import tqdm
+
+from .array_network import ArrayNetwork
+from .fruit_fly_network import get_fruit_fly_network
+from .monitors import Supervisor
+
+
+def override_grid(axes: dict) -> list:
+    '''The cartesian product of parameter values as a list of overrides
+    for get_fruit_fly_network. Each key of axes is a path starting with
+    a keyword argument of get_fruit_fly_network followed by the nested
+    keys, e.g. ('conductance_dict', ('EIP', 'PEI')).'''
+    overrides = []
+    for values in product(*axes.values()):
+        override = {}
+        for path, value in zip(axes.keys(), values):
+            entry = override
+            for key in path[:-1]:
+                entry = entry.setdefault(key, {})
+            entry[path[-1]] = value
+        overrides.append(override)
+    return overrides
+
+
+def _build(overrides, cue_dict, start_time, dt, num_steps):
+    nets = get_fruit_fly_network(overrides=overrides)
+    for net in nets:
+        for name, intervals in cue_dict.items():
+            net[name].intervals += intervals
+        net.set_time_params(start_time, dt, num_steps)
+    return ArrayNetwork(nets)
+
+
+def _run_batch(path, runs, overrides, cue_dict, start_time, dt, num_steps,
+               monitors=None, window=1000):
+    '''Simulate a batch of runs as replicas of one engine and store
+    their spikes in the sweep directory.'''
+    engine = _build(overrides, cue_dict, start_time, dt, num_steps)
+    engine.reset()
+    if monitors:
+        supervisor = Supervisor(monitors)
+        engine.run(num_steps, callback=supervisor, every=window)
+        reasons = [monitor.reason for monitor in monitors]
+        aborts = np.load(os.path.join(path, 'aborts.npy'), mmap_mode='r+')
+        for replica, (time_index, reason) in supervisor.aborted.items():
+            aborts[runs[replica]] = (time_index, reasons.index(reason))
+        aborts.flush()
+    else:
+        engine.advance(num_steps)
+
+    spikes = np.load(os.path.join(path, 'spikes.npy'), mmap_mode='r+')
+    counts = np.load(os.path.join(path, 'counts.npy'), mmap_mode='r+')
+    max_spikes = spikes.shape[1]
+    recorded = engine.recorder.table()
+    replica, cluster = np.divmod(recorded[:, 0], len(engine.names))
+    for r, run in enumerate(runs):
+        table = np.stack((cluster[replica == r],
+                          recorded[replica == r, 1]), axis=1)
+        stored = min(len(table), max_spikes)
+        spikes[run, :stored] = table[:stored]
+        spikes.flush()
+        counts[run] = len(table)
+        counts.flush()
+    return runs
+
+
+def run_sweep(path: str,
+              overrides: list,
+              cue_dict: dict,
+              start_time: float,
+              end_time: float,
+              dt: float,
+              max_spikes: int = 1_000_000,
+              batch_size: int = 1,
+              workers: int = None,
+              monitors: list = None,
+              window: int = 1000):
+    '''Simulate the fruit fly network once per override, in parallel,
+    storing the results in the directory path. Runs finished by an
+    earlier call with the same arguments are skipped. With monitors (see
+    monitors.py), checked every window steps, hopeless runs are aborted
+    early. Warns about runs with more than max_spikes spikes, of which
+    only the first max_spikes are stored.'''
+    num_steps = round((end_time - start_time)/dt)
+    spec = {
+        'runs': len(overrides),
+        'start_time': start_time,
+        'dt': dt,
+        'num_steps': num_steps,
+        'max_spikes': max_spikes,
+        'overrides': repr(overrides),
+        'cue_dict': repr(cue_dict),
+        'monitors': [monitor.spec() for monitor in monitors]
+        if monitors else None,
+        'reasons': [monitor.reason for monitor in monitors]
+        if monitors else None,
+        'window': window if monitors else None
+    }
+    spec_path = os.path.join(path, 'sweep.json')
+    if os.path.exists(spec_path):
+        with open(spec_path) as f:
+            old_spec = json.load(f)
+        assert all(old_spec.get(key) == value
+                   for key, value in spec.items()), \
+            f'{path} holds a different sweep.'
+    else:
+        os.makedirs(path, exist_ok=True)
+        names = list(_build(overrides[:1], cue_dict, start_time, dt,
+                            num_steps).names)
+        np.lib.format.open_memmap(
+                os.path.join(path, 'spikes.npy'), mode='w+',
+                dtype=np.int32, shape=(len(overrides), max_spikes, 2))
+        counts = np.lib.format.open_memmap(
+                os.path.join(path, 'counts.npy'), mode='w+',
+                dtype=np.int64, shape=(len(overrides),))
+        counts[:] = -1
+        counts.flush()
+        del counts
+        aborts = np.lib.format.open_memmap(
+                os.path.join(path, 'aborts.npy'), mode='w+',
+                dtype=np.int64, shape=(len(overrides), 2))
+        aborts[:] = -1
+        aborts.flush()
+        del aborts
+        with open(spec_path, 'w') as f:
+            json.dump({**spec, 'names': names}, f, indent=4)
+
+    counts = np.load(os.path.join(path, 'counts.npy'), mmap_mode='r')
+    pending = [run for run in range(len(overrides)) if counts[run] < 0]
+    del counts
+    batches = [pending[i:i+batch_size]
+               for i in range(0, len(pending), batch_size)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_run_batch, path, runs,
+                        [overrides[run] for run in runs], cue_dict,
+                        start_time, dt, num_steps, monitors, window)
+            for runs in batches]
+        with tqdm(total=len(pending)) as progress:
+            for future in as_completed(futures):
+                progress.update(len(future.result()))
+
+    result = SweepResult(path)
+    truncated = result.truncated_runs()
+    if truncated:
+        warnings.warn(f'Runs {truncated} of {path} exceeded max_spikes '
+                      f'{max_spikes}, their spikes are truncated.')
+    return result
+
+
+class SweepResult:
+    '''Lazy, read only access to the spikes of a finished sweep.'''
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'sweep.json')) as f:
+            self.spec = json.load(f)
+        self.names = self.spec['names']
+        self.dt = self.spec['dt']
+        self.start_time = self.spec['start_time']
+        self.num_steps = self.spec['num_steps']
+        self.spikes = np.load(os.path.join(path, 'spikes.npy'), mmap_mode='r')
+        self.counts = np.load(os.path.join(path, 'counts.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return self.spec['runs']
+
+    def finished(self, run: int) -> bool:
+        return self.counts[run] >= 0
+
+    def aborted(self, run: int):
+        '''The (time index, reason) a monitor aborted the run at, or
+        None if it ran to the end.'''
+        path = os.path.join(self.path, 'aborts.npy')
+        if not os.path.exists(path):
+            return None
+        time_index, reason = np.load(path, mmap_mode='r')[run]
+        if time_index < 0:
+            return None
+        return int(time_index), self.spec['reasons'][reason]
+
+    def truncated(self, run: int) -> bool:
+        '''Whether the run had more spikes than max_spikes.'''
+        return self.counts[run] > self.spikes.shape[1]
+
+    def truncated_runs(self) -> list:
+        return np.flatnonzero(
+                np.asarray(self.counts) > self.spikes.shape[1]).tolist()
+
+    def spike_table(self, run: int, partial: bool = False):
+        '''The (cluster, time index) rows of a run in time order. Raises
+        a ValueError for truncated runs unless partial, in which case
+        only their first max_spikes spikes are returned.'''
+        assert self.finished(run), f'Run {run} has not finished.'
+        if self.truncated(run) and not partial:
+            raise ValueError(
+                    f'Run {run} has {self.counts[run]} spikes, only the '
+                    f'first {self.spikes.shape[1]} were stored.')
+        return np.asarray(
+                self.spikes[run, :min(self.counts[run], self.spikes.shape[1])])
+
+    def spike_dict(self, run: int, partial: bool = False) -> dict:
+        '''The firing time indices of each cluster, in the layout the
+        sim scripts pickle.'''
+        table = self.spike_table(run, partial)
+        return {name: table[table[:, 0] == i, 1].tolist()
+                for i, name in enumerate(self.names)}
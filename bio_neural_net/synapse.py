@@ -1,6 +1,8 @@
 '''A collection of classes to simulate the model from Su et al. 2017
 https://www.nature.com/articles/s41467-017-00191-6
 '''
+from math import exp
+
 import numpy as np
 
 
@@ -15,6 +17,11 @@ class SynapseCluster:
         self.gating = 0.0
         self._update = 0.0
 
+        # event driven updates store the gating with the time index it
+        # was last updated at and decay it exactly when it is read
+        self.gating_index = 0
+        self._update_index = 0
+
         self.time_constant = time_constant
         self.max_conductance = max_conductance
         self.reversal_potential = reversal_potential
@@ -25,17 +32,26 @@ class SynapseCluster:
     def __repr__(self):
         return str(self) + f' @ {id(self)}'
 
+    def key(self) -> tuple:
+        '''The parameters identifying equivalent synapses.'''
+        return (type(self),
+                self.time_constant,
+                self.max_conductance,
+                self.reversal_potential)
+
     def __eq__(self, syn):
-        return all((
-            type(self) == type(syn),
-            self.time_constant == syn.time_constant,
-            self.max_conductance == syn.max_conductance,
-            self.reversal_potential == syn.reversal_potential
-        ))
+        return self.key() == syn.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def conductance(self, V, gating=None):
+        if gating is None:
+            gating = self.gating
+        return self.pre_size * self.max_conductance * gating
 
-    def current(self, V):
-        return self.pre_size * self.max_conductance * self.gating * \
-                (V - self.reversal_potential)
+    def current(self, V, gating=None):
+        return self.conductance(V, gating) * (V - self.reversal_potential)
 
     def compute_update(self, dt: float, firing: bool):
         self._update = self.gating - self.gating/self.time_constant*dt
@@ -44,23 +60,105 @@ class SynapseCluster:
 
     def store_update(self) -> None:
         self.gating = self._update
+        self.gating_index = self._update_index
+
+    def gating_at(self, time_index: int, dt: float) -> float:
+        '''The exact exponential decay of the gating variable from the
+        last event to time_index.'''
+        if self.gating == 0:
+            return 0.0
+        return self.gating * exp(
+                -(time_index - self.gating_index)*dt/self.time_constant)
+
+    def jump(self, gating: float) -> float:
+        '''The increase in gating caused by a presynaptic spike.'''
+        return 1
+
+    def compute_event(self, time_index: int, dt: float):
+        '''Event driven counterpart of compute_update, only called on
+        steps where the presynaptic cluster fires.'''
+        gating = self.gating_at(time_index, dt)
+        self._update = gating*exp(-dt/self.time_constant) + \
+            self.jump(gating)
+        self._update_index = time_index + 1
 
     def reset(self):
         assert self.pre_size is not None
         self.gating *= 0.0
+        self.gating_index = 0
+        self._update_index = 0
 
 
 class NMDASynapseCluster(SynapseCluster):
     ALPHA = 0.63
     MG2 = 1.0
 
-    def current(self, V):
-        conductance = self.max_conductance / (
-            1 + self.MG2 * np.exp(-0.062*V/3.57))
-        return conductance * self.gating * \
-            (V - self.reversal_potential)
+    def mg_block(self, V) -> float:
+        '''The voltage dependent Mg2+ block, shared by all NMDA synapses
+        onto a cluster.'''
+        return 1/(1 + self.MG2 * np.exp(-0.062*V/3.57))
+
+    def conductance(self, V, gating=None, mg_block=None):
+        if gating is None:
+            gating = self.gating
+        if mg_block is None:
+            mg_block = self.mg_block(V)
+        return self.max_conductance * mg_block * gating
 
     def compute_update(self, dt: float, firing: bool):
         self._update = self.gating - self.gating/self.time_constant*dt
         if firing:
             self._update += self.ALPHA * (1 - self.gating)
+
+    def jump(self, gating: float) -> float:
+        return self.ALPHA * (1 - gating)
+
+
+class ReceptorCluster(SynapseCluster):
+    '''The summed conductance of the linear synapses sharing a time
+    constant and reversal potential onto one cluster, see
+    Network.aggregate_receptors. The gating variable holds the total
+    conductance and a spike of a source adds the weight (max conductance
+    times presynaptic size) of its synapse.
+
+    Receptors are updated by their postsynaptic cluster, sources only
+    deposit their spikes with receive. A spike is applied on the step
+    after the one it fired in, just as for the synapses updated by their
+    presynaptic cluster.
+    '''
+    def __init__(self, time_constant: float, reversal_potential: float):
+        super().__init__(time_constant, 1.0, reversal_potential)
+        self.pre_size = 1
+        self.num_sources = 0
+        self._pending = 0.0  # spikes of the previous step
+        self._incoming = 0.0  # spikes of the current step
+
+    def __str__(self):
+        return f'Receptor: {self.num_sources} sources'
+
+    def receive(self, weight: float):
+        self._incoming += weight
+
+    def gating_at(self, time_index: int, dt: float) -> float:
+        return self.gating
+
+    def compute_receptor(self, dt: float, exact: bool = False):
+        if self.gating == 0:
+            self._update = self._pending
+            return
+        if exact:
+            decay = exp(-dt/self.time_constant)
+        else:
+            decay = 1 - dt/self.time_constant
+        self._update = self.gating*decay + self._pending
+
+    def store_update(self) -> None:
+        self.gating = self._update
+        self._pending = self._incoming
+        self._incoming = 0.0
+
+    def reset(self):
+        super().reset()
+        self._update = 0.0
+        self._pending = 0.0
+        self._incoming = 0.0
@@ -0,0 +1,97 @@
+'''Saving and loading the topology of a built Network.
+
+The clusters, their parameters and the synapses are stored as flat
+arrays in a single .npz file, so a network can be rebuilt without
+repeating whatever produced it. Equal synapses sharing a presynaptic
+cluster are stored once and shared again when loading, and the
+connections keep their order, so a loaded network simulates exactly
+like the original. Input intervals and rates are not part of the
+topology.
+'''
+import os
+
+import numpy as np
+
+from .network import Network
+from .neuron import InputNeuronCluster, NeuronCluster
+from .synapse import NMDASynapseCluster, SynapseCluster
+
+SYNAPSE_TYPES = (SynapseCluster, NMDASynapseCluster)
+
+
+def save_topology(path: str, net: Network):
+    '''Write the topology of net to path, atomically.'''
+    neurons = list(net.neurons.values())
+    index = {neuron.name: i for i, neuron in enumerate(neurons)}
+    is_input = [isinstance(neuron, InputNeuronCluster) for neuron in neurons]
+
+    syn_index = {}
+    for syn in net.synapses.values():
+        syn_index.setdefault(id(syn), (len(syn_index), syn))
+    syns = [syn for _, syn in syn_index.values()]
+
+    arrays = {
+        'names': np.array([neuron.name for neuron in neurons]),
+        'is_input': np.array(is_input),
+        'size': np.array([neuron.size for neuron in neurons]),
+        'freq': np.array([neuron.freq if input_ else np.nan
+                          for neuron, input_ in zip(neurons, is_input)]),
+        'poisson': np.array([input_ and neuron.poisson
+                             for neuron, input_ in zip(neurons, is_input)]),
+        # -1 for no seed
+        'seed': np.array([neuron.seed if input_ and neuron.seed is not None
+                          else -1
+                          for neuron, input_ in zip(neurons, is_input)]),
+        **{param: np.array([np.nan if input_ else getattr(neuron, param)
+                            for neuron, input_ in zip(neurons, is_input)])
+           for param in ('Cm', 'gL', 'VL', 'threshold')},
+        'syn_type': np.array([SYNAPSE_TYPES.index(type(syn))
+                              for syn in syns]),
+        'syn_tau': np.array([syn.time_constant for syn in syns]),
+        'syn_gmax': np.array([syn.max_conductance for syn in syns]),
+        'syn_E': np.array([syn.reversal_potential for syn in syns]),
+        'pre': np.array([index[pre] for pre, _ in net.synapses.keys()]),
+        'post': np.array([index[post] for _, post in net.synapses.keys()]),
+        'syn': np.array([syn_index[id(syn)][0]
+                         for syn in net.synapses.values()])
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temp_path, path)
+
+
+def load_topology(path: str) -> Network:
+    '''A new Network with the topology stored in path.'''
+    with np.load(path) as arrays:
+        arrays = dict(arrays)
+    names = arrays['names'].tolist()
+    size = arrays['size'].tolist()
+
+    net = Network()
+    net.add_neurons(*(
+        InputNeuronCluster(name, size[i], arrays['freq'][i].item(),
+                           poisson=bool(arrays['poisson'][i]),
+                           seed=None if arrays['seed'][i] < 0
+                           else arrays['seed'][i].item())
+        if arrays['is_input'][i] else
+        NeuronCluster(name, size[i],
+                      **{param: arrays[param][i].item()
+                         for param in ('Cm', 'gL', 'VL', 'threshold')})
+        for i, name in enumerate(names)))
+
+    syns = [
+        SYNAPSE_TYPES[syn_type](time_constant=tau,
+                                max_conductance=gmax,
+                                reversal_potential=E)
+        for syn_type, tau, gmax, E in zip(arrays['syn_type'].tolist(),
+                                          arrays['syn_tau'].tolist(),
+                                          arrays['syn_gmax'].tolist(),
+                                          arrays['syn_E'].tolist())]
+    net.add_synapses(
+        (names[pre], names[post], syns[syn])
+        for pre, post, syn in zip(arrays['pre'].tolist(),
+                                  arrays['post'].tolist(),
+                                  arrays['syn'].tolist()))
+    return net
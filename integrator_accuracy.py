@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+'''Compare the spikes of the membrane integrators at several step sizes
+with those of forward Euler at a tenth of the default step size.'''
+import time
+
+import numpy as np
+
+from bio_neural_net.experiment import build_network, load_spec
+
+######################################################################
+# Experiment Parameters
+######################################################################
+
+spec = load_spec('experiments/sim2.json')
+end_time = 2.0  # s, the cue and the bump that outlasts it
+reference_dt = 1e-5
+step_sizes = [1e-4, 2e-4, 5e-4, 1e-3]
+engines = [
+    ('euler', False),
+    ('exponential', False),
+    ('exponential', True)  # with exact event driven synapses
+]
+
+######################################################################
+# End Experiment Parameters
+######################################################################
+
+
+def spike_counts(integrator: str, event_synapses: bool, dt: float):
+    '''The number of spikes of every cluster and the wall time.'''
+    net = build_network({**spec, 'end_time': end_time, 'dt': dt,
+                         'engine': {'integrator': integrator,
+                                    'event_synapses': event_synapses}})
+    engine = net.compile()
+    engine.reset()
+    tic = time.perf_counter()
+    engine.advance(net.num_steps)
+    elapsed = time.perf_counter() - tic
+    counts = np.array([len(indices) for indices
+                       in engine.recorder.spike_dict().values()])
+    return counts, elapsed
+
+
+if __name__ == '__main__':
+    reference, _ = spike_counts('euler', False, reference_dt)
+    print(f'reference: euler at dt {reference_dt:g}, '
+          f'{reference.sum()} spikes')
+    print(f'{"integrator":>12} {"synapses":>8} {"dt":>6} {"spikes":>7} '
+          f'{"total err":>9} {"cluster err":>11} {"time (s)":>8}')
+    for integrator, event_synapses in engines:
+        for dt in step_sizes:
+            counts, elapsed = spike_counts(integrator, event_synapses, dt)
+            # relative error of the total and summed over the clusters
+            total = abs(counts.sum() - reference.sum())/reference.sum()
+            cluster = np.abs(counts - reference).sum()/reference.sum()
+            synapses = 'event' if event_synapses else 'euler'
+            print(f'{integrator:>12} {synapses:>8} {dt:>6g} '
+                  f'{counts.sum():>7} {total:>9.1%} {cluster:>11.1%} '
+                  f'{elapsed:>8.2f}')
@@ -1,8 +1,6 @@
 #!/usr/bin/python3
 import os
-import pickle
 
-import matplotlib.pyplot as plt
 import numpy as np
 from tqdm import tqdm
 
@@ -12,6 +10,7 @@ from bio_neural_net.fruit_fly_network import (
         INPUT_SYNAPSE_CONDUCTANCE,
         CONDUCTANCE_DICT
 )
+from bio_neural_net.results import save_results
 
 ######################################################################
 # Experiment Parameters
@@ -22,8 +21,8 @@ start_time = 0.0
 end_time = 1.0  # adjusted to match step size
 dt = 1e-4
 
-pickle_dir = 'sim_data'
-file_name = 'sim1.pickle'
+data_dir = 'sim_data'
+file_name = 'sim1.spikes'
 
 # changed params
 input_neurons = INPUT_NEURONS.copy()
@@ -85,24 +84,30 @@ net.reset()
 #######################
 if __name__ == '__main__':
     # net.print_full()
-    voltages = [[] for _ in neurons]
-    for step in tqdm(range(steps)):
-        for i, name in enumerate(neurons):
-            voltages[i].append(net[name].V)
-        net.update()
+    voltages = net.probe('V', neurons)
+    with tqdm(total=steps) as progress:
+        def show_progress(net):
+            progress.update(net.time_index - progress.n)
+
+        net.run(steps, callback=show_progress, every=1000)
 
     neuron_dict = {neuron.name: neuron.firing_time_indices
                    for neuron in net.neurons.values()}
 
-    with open(os.path.join(pickle_dir, file_name), 'wb') as f:
-        pickle.dump((ts, neuron_dict), f)
+    save_results(os.path.join(data_dir, file_name), neuron_dict,
+                 start_time, dt, steps,
+                 spec={'cue_dict': cue_dict,
+                       'input_neurons': input_neurons,
+                       'input_synapse_conductance': input_synapse_conductance,
+                       'conductance_dict': conductance_dict})
 
     total_spikes = sum(len(lst) for lst in neuron_dict.values())
 
     print(f'Total spikes: {total_spikes}')
 
-    for name, Vs in zip(neurons, voltages):
-        plt.plot(ts, Vs, '.-', label=name)
+    import matplotlib.pyplot as plt
+    for name, Vs in zip(neurons, voltages.values.T):
+        plt.plot(voltages.times, Vs, '.-', label=name)
     plt.ylabel('voltage (mV)')
     plt.legend()
 
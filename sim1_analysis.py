@@ -1,37 +1,33 @@
 #!/usr/bin/python3
 
 import os.path
-import pickle
 
 import matplotlib.pyplot as plt
 import numpy as np
 
-with open(os.path.join('sim_data', 'sim1.pickle'), 'rb') as f:
-    ts, spike_dict = pickle.load(f)
+from bio_neural_net.plotting import raster
+from bio_neural_net.rates import rate_matrix
+from bio_neural_net.results import SimulationResults
+
+spike_dict = SimulationResults(os.path.join('sim_data', 'sim1.spikes'))
+ts = spike_dict.ts
 
 filtered_spike_dict = {
         name: time_indices
         for name, time_indices in spike_dict.items()
         if len(time_indices) != 0}
-for height, (name, time_indices) in enumerate(filtered_spike_dict.items()):
-    plt.plot(ts, height + 0*ts, 'k-', linewidth=0.1)
-    plt.plot(ts[time_indices], [height]*len(time_indices), '.')
-    plt.text(ts[-1], height, name)
-
+fig, ax = plt.subplots()
+raster(ax, spike_dict, names=list(filtered_spike_dict.keys()))
 plt.show()
 
 
 zs = np.linspace(ts[0], ts[-1], 401)
 
-def kern(t, scale=0.05):
-    '''A smoothing kernel.'''
-    return 1/scale*np.heaviside(t, .5)*np.exp(-t/scale)
-
+rates = rate_matrix(filtered_spike_dict, ts, zs)
 max_rates = -1
-for name, time_indices in filtered_spike_dict.items():
-    rates = sum(kern(zs - ts[i]) for i in time_indices)
-    max_rates = max(max_rates, np.max(rates))
-    plt.semilogy(zs, rates, label=name)
+for name, rate in zip(filtered_spike_dict.keys(), rates):
+    max_rates = max(max_rates, np.max(rate))
+    plt.semilogy(zs, rate, label=name)
 
 plt.ylim(1, max_rates*1.1)
 plt.grid(which='minor', axis='y', alpha=0.3)
@@ -1,8 +1,6 @@
 #!/usr/bin/python3
-import matplotlib.pyplot as plt
 import numpy as np
 import os
-import pickle
 
 from tqdm import tqdm
 
@@ -12,8 +10,7 @@ from bio_neural_net.fruit_fly_network import (
         INPUT_SYNAPSE_CONDUCTANCE,
         CONDUCTANCE_DICT
 )
-
-from itertools import product
+from bio_neural_net.results import save_results
 
 ######################################################################
 # Experiment Parameters
@@ -24,8 +21,8 @@ start_time = 0.0
 end_time = 10.0  # adjusted to match step size
 dt = 1e-4
 
-pickle_dir = 'sim_data'
-file_name = 'sim2.pickle'
+data_dir = 'sim_data'
+file_name = 'sim2.spikes'
 
 # changed params
 input_neurons = INPUT_NEURONS.copy()
@@ -75,17 +72,24 @@ for name, intervals in cue_dict.items():
     net[name].intervals += intervals
 
 net.set_time_params(start_time, dt, steps)
-net.reset()
+engine = net.compile()
+engine.reset()
 
 #######################
 # main
 #######################
 if __name__ == '__main__':
-    for step in tqdm(range(steps)):
-        net.update()
+    with tqdm(total=steps) as progress:
+        def show_progress(engine):
+            progress.update(engine.time_index - progress.n)
+
+        engine.run(steps, callback=show_progress, every=1000)
 
-    neuron_dict = {neuron.name: neuron.firing_time_indices
-                   for neuron in net.neurons.values()}
+    neuron_dict = engine.recorder.spike_dict()
 
-    with open(os.path.join(pickle_dir, file_name), 'wb') as f:
-        pickle.dump((ts, neuron_dict), f)
+    save_results(os.path.join(data_dir, file_name), neuron_dict,
+                 start_time, dt, steps,
+                 spec={'cue_dict': cue_dict,
+                       'input_neurons': input_neurons,
+                       'input_synapse_conductance': input_synapse_conductance,
+                       'conductance_dict': conductance_dict})
@@ -0,0 +1,79 @@
+'''The result, analysis and topology caches.'''
+import os
+
+import numpy as np
+
+from bio_neural_net import fruit_fly_network
+from bio_neural_net.analysis import AnalysisCache
+from bio_neural_net.experiment import ResultCache
+from bio_neural_net.rates import rate_matrix
+from bio_neural_net.results import SimulationResults, save_results
+
+
+def make_results(path, num_steps=20_000, seed=0):
+    rng = np.random.default_rng(seed)
+    spike_dict = {name: np.sort(rng.choice(num_steps, 200, replace=False))
+                  for name in ['a', 'b', 'c']}
+    save_results(path, spike_dict, 0.0, 1e-4, num_steps)
+    return SimulationResults(path)
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1 << 20)
+    for key in ['first', 'second']:
+        cache.put(key, {'a': [1, 2, 3]}, 0.0, 1e-4, 10, spec=None)
+    os.utime(cache.file_path('first'), (0, 0))
+    os.utime(cache.file_path('second'), (1, 1))
+    assert list(cache.get('first')['a']) == [1, 2, 3]  # now most recent
+
+    cache.max_bytes = os.path.getsize(cache.file_path('first'))*2
+    cache.put('third', {'a': [4]}, 0.0, 1e-4, 10, spec=None)
+    assert cache.get('second') is None
+    assert cache.get('first') is not None
+    assert cache.get('third') is not None
+
+
+def test_analysis_cache_rates(tmp_path):
+    results = make_results(str(tmp_path/'run.spikes'))
+    cache = AnalysisCache(str(tmp_path/'analysis'))
+    zs, rates = cache.rates(results)
+    assert np.allclose(rates, rate_matrix(results, results.ts, zs))
+    zs_again, rates_again = cache.rates(results)
+    assert np.array_equal(rates_again, rates)
+
+
+def test_analysis_cache_extends_prefix(tmp_path):
+    cache = AnalysisCache(str(tmp_path/'analysis'))
+    full = make_results(str(tmp_path/'full.spikes'), 20_000)
+    spikes = {name: full[name][full[name] < 10_000] for name in full}
+    save_results(str(tmp_path/'short.spikes'), spikes, 0.0, 1e-4, 10_000)
+    short = SimulationResults(str(tmp_path/'short.spikes'))
+    cache.rates(short)
+    zs, rates = cache.rates(full)
+    assert np.allclose(rates, rate_matrix(full, full.ts, zs))
+
+
+def test_analysis_cache_evicts(tmp_path):
+    cache = AnalysisCache(str(tmp_path/'analysis'), max_bytes=0)
+    for seed in range(2):
+        results = make_results(str(tmp_path/f'{seed}.spikes'), seed=seed)
+        cache.rates(results)
+    entries = [entry for lineage in os.listdir(cache.path)
+               for entry in os.listdir(os.path.join(cache.path, lineage))]
+    assert len(entries) == 1  # only the entry just written is kept
+
+
+def test_topology_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(fruit_fly_network, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(fruit_fly_network, 'TOPOLOGY_CACHE_SIZE', 1)
+    built = fruit_fly_network.get_fruit_fly_network(cache=True)
+    loaded = fruit_fly_network.get_fruit_fly_network(cache=True)
+    assert list(loaded.neurons) == list(built.neurons)
+    assert list(loaded.synapses) == list(built.synapses)
+    assert len(os.listdir(tmp_path)) == 1
+
+    fruit_fly_network.get_fruit_fly_network(
+            conductance_dict={**fruit_fly_network.CONDUCTANCE_DICT,
+                              ('EIP', 'PEI'): 11},
+            cache=True)
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,64 @@
+'''The engines simulate the same network alike.'''
+from bio_neural_net import ArrayNetwork
+from bio_neural_net.event_network import EventNetwork
+from bio_neural_net.fruit_fly_network import get_fruit_fly_network
+
+STEPS = 2000
+
+
+def make_network():
+    net = get_fruit_fly_network()
+    net['EB-L1_input'].intervals += [(0, 0.1)]
+    net['RPEN_input'].intervals += [(0, 0.2)]
+    net.set_time_params(0.0, 1e-4, STEPS)
+    return net
+
+
+def object_spikes(net):
+    net.reset()
+    net.run()
+    return {name: neuron.firing_time_indices
+            for name, neuron in net.neurons.items()}
+
+
+def test_array_network_matches_object_model():
+    expected = object_spikes(make_network())
+    engine = make_network().compile()
+    engine.reset()
+    engine.run()
+    spikes = engine.recorder.spike_dict()
+    assert sum(map(len, expected.values())) > 0
+    assert {name: list(indices) for name, indices in spikes.items()} \
+        == expected
+
+
+def test_array_network_replicas_match():
+    nets = get_fruit_fly_network(overrides=[{}, {}])
+    for net in nets:
+        net['EB-L1_input'].intervals += [(0, 0.1)]
+        net.set_time_params(0.0, 1e-4, STEPS)
+    expected = object_spikes(nets[0])
+    engine = ArrayNetwork(nets)
+    engine.reset()
+    engine.run()
+    replica = engine.recorder.table()[:, 0] // len(engine.names)
+    total = sum(map(len, expected.values()))
+    assert (replica == 0).sum() == (replica == 1).sum() == total
+
+
+def test_event_network_follows_object_model():
+    net = make_network()
+    net.set_integrator('exponential')
+    net.set_event_synapses()
+    engine = EventNetwork(net)
+    engine.reset()
+    engine.run()
+    spikes = engine.recorder.spike_dict()
+    expected = object_spikes(net)
+    # the input spikes are scheduled, so they agree exactly
+    for i, name in enumerate(engine.names):
+        if engine.is_input[i]:
+            assert list(spikes[name]) == expected[name]
+    total = sum(map(len, spikes.values()))
+    expected_total = sum(map(len, expected.values()))
+    assert abs(total - expected_total) <= 0.1*expected_total
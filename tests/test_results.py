@@ -0,0 +1,29 @@
+'''The .spikes results format.'''
+import numpy as np
+
+from bio_neural_net.results import SimulationResults, save_results
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path/'run.spikes')
+    spike_dict = {'a': [3, 7, 7000000], 'b': [], 'c': np.array([0, 1, 2])}
+    spec = {'dt': np.float64(1e-4), 'cues': [(0, 0.5)]}
+    save_results(path, spike_dict, 0.5, 1e-4, 10_000_000, spec=spec)
+
+    results = SimulationResults(path)
+    assert results.keys() == ['a', 'b', 'c']
+    assert (results.start_time, results.dt, results.num_steps) == \
+        (0.5, 1e-4, 10_000_000)
+    assert results.spec == {'dt': 1e-4, 'cues': [[0, 0.5]]}
+    for name, indices in spike_dict.items():
+        assert list(results[name]) == list(indices)
+    assert list(results.firing_time_indices('a', start=4, stop=8)) == [7]
+    assert np.allclose(results.firing_times('c'), 0.5 + np.arange(3)*1e-4)
+
+
+def test_empty(tmp_path):
+    path = str(tmp_path/'empty.spikes')
+    save_results(path, {'a': []}, 0.0, 1e-4, 10)
+    results = SimulationResults(path)
+    assert len(results['a']) == 0
+    assert results.spec is None
@@ -0,0 +1,55 @@
+'''Block stepping and its callbacks.'''
+import io
+
+import pytest
+from tqdm import tqdm
+
+from bio_neural_net import InputNeuronCluster, Network, NeuronCluster
+from bio_neural_net.fruit_fly_network import DEFAULT_NEURON_PARAMS
+
+STEPS = 1000
+
+
+def make_network():
+    net = Network()
+    net.set_time_params(0.0, 1e-4, STEPS)
+    net.add_neurons(InputNeuronCluster('input', 1, 50, (0.0, 0.1)),
+                    NeuronCluster('n1', **DEFAULT_NEURON_PARAMS))
+    return net
+
+
+@pytest.mark.parametrize('engine', ['object', 'array'])
+def test_progress_callback_runs_to_the_end(engine):
+    net = make_network()
+    if engine == 'array':
+        net = net.compile()
+    calls = []
+    # a redrawn bar returns True from update, which must not stop the run
+    with tqdm(total=STEPS, file=io.StringIO(), mininterval=0) as bar:
+        def show_progress(engine):
+            bar.update(engine.time_index - bar.n)
+            calls.append(engine.time_index)
+
+        assert net.run(callback=show_progress, every=100) == STEPS
+    assert net.time_index == STEPS
+    assert calls == list(range(100, STEPS + 1, 100))
+
+
+def test_callback_stops_the_run():
+    net = make_network()
+    taken = net.run(callback=lambda engine: engine.time_index >= 300,
+                    every=100)
+    assert taken == net.time_index == 300
+
+
+def test_last_block_is_partial():
+    net = make_network()
+    calls = []
+    net.run(250, callback=lambda engine: calls.append(engine.time_index),
+            every=100)
+    assert calls == [100, 200, 250]
+
+
+def test_every_must_be_positive():
+    with pytest.raises(ValueError):
+        make_network().run(callback=lambda engine: None, every=0)